@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""Benchmarks of the mentor.binpack heuristics
+
+Generates synthetic offer and task populations, packs them with every
+heuristic and reports the wall-clock time together with the packing quality:
+utilisation per resource, number of skipped tasks and bins used.
+
+Results are emitted as JSON lines (one record per population and heuristic)
+so they can be stored and compared between releases. The script benchmarks
+the mentor package of the checkout it lives in, run it from anywhere, e.g.
+
+    python benchmarks/binpack.py --tasks 10000 --offers 500 > results.jsonl
+    python benchmarks/binpack.py --format table
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+# benchmark the checkout this script belongs to, not an installed release
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mentor
+from mentor import binpack
+from mentor.proxies.messages import Cpus, Disk, Mem, Offer, TaskInfo
+
+try:
+    from mentor import binpack_numpy
+except ImportError:  # numpy is an optional dependency
+    binpack_numpy = None
+
+
+WEIGHTS = dict(cpus=1, mem=1)
+
+HEURISTICS = [('ff', binpack.ff, {}),
+              ('ffd', binpack.ffd, WEIGHTS),
+              ('mr', binpack.mr, WEIGHTS),
+              ('mrpq', binpack.mrpq, WEIGHTS),
+              ('bf', binpack.bf, WEIGHTS),
+              ('bfd', binpack.bfd, WEIGHTS),
+              ('bfh', binpack.bfh, WEIGHTS),
+              ('bfhd', binpack.bfhd, WEIGHTS),
+              ('dp', binpack.dp, WEIGHTS),
+              ('dpd', binpack.dpd, WEIGHTS),
+              ('l2', binpack.l2, WEIGHTS),
+              ('l2d', binpack.l2d, WEIGHTS)]
+
+if binpack_numpy is not None:
+    HEURISTICS += [('numpy.ff', binpack_numpy.ff, {}),
+                   ('numpy.ffd', binpack_numpy.ffd, WEIGHTS),
+                   ('numpy.mr', binpack_numpy.mr, WEIGHTS),
+                   ('numpy.bf', binpack_numpy.bf, WEIGHTS),
+                   ('numpy.bfd', binpack_numpy.bfd, WEIGHTS)]
+
+
+def task(cpus, mem, disk=0):
+    return TaskInfo(resources=[Cpus(cpus), Mem(mem), Disk(disk)])
+
+
+def uniform(rnd, n):
+    return [task(round(rnd.uniform(0.1, 2.0), 1), rnd.randint(64, 4096))
+            for _ in range(n)]
+
+
+def heavy_tailed(rnd, n):
+    return [task(round(min(0.1 * rnd.paretovariate(1.2), 16), 1),
+                 int(min(64 * rnd.paretovariate(1.2), 65536)))
+            for _ in range(n)]
+
+
+def typical(rnd, n):
+    # mostly tiny python tasks with a few huge ones
+    return [task(0.1, 128) if rnd.random() < 0.98 else
+            task(rnd.choice([4, 8]), rnd.choice([8192, 16384]))
+            for _ in range(n)]
+
+
+POPULATIONS = [('uniform', uniform),
+               ('heavy-tailed', heavy_tailed),
+               ('typical', typical)]
+
+
+def offers(rnd, n):
+    # partially allocated agents of a few typical host sizes
+    hosts = [(4, 8192, 51200), (8, 16384, 102400), (16, 65536, 204800)]
+    result = []
+    for _ in range(n):
+        cpus, mem, disk = rnd.choice(hosts)
+        free = rnd.uniform(0.2, 1.0)
+        result.append(Offer(resources=[Cpus(round(cpus * free, 1)),
+                                       Mem(int(mem * free)),
+                                       Disk(int(disk * free))]))
+    return result
+
+
+def quality(bins, skip, targets):
+    used = [b for b in bins if len(b[1])]
+    utilisation = {}
+    for attr in binpack.RESOURCES:
+        offered = sum(float(getattr(t, attr)) for t in targets)
+        allocated = sum(float(getattr(item, attr))
+                        for _, content in bins for item in content)
+        utilisation[attr] = allocated / offered if offered else 0.0
+    return {'skipped': len(skip),
+            'bins_used': len(used),
+            'utilisation': utilisation}
+
+
+def measure(fn, items, targets, kwargs, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        bins, skip = fn(items, targets, **kwargs)
+        timings.append(time.time() - start)
+    return min(timings), bins, skip
+
+
+def run(tasks, n_offers, seed, repeat, heuristics=None, populations=None):
+    for population, generate in POPULATIONS:
+        if populations and population not in populations:
+            continue
+        rnd = random.Random(seed)
+        items = generate(rnd, tasks)
+        targets = offers(rnd, n_offers)
+        for name, fn, kwargs in HEURISTICS:
+            if heuristics and name not in heuristics:
+                continue
+            seconds, bins, skip = measure(fn, items, targets, kwargs, repeat)
+            record = {'version': mentor.__version__,
+                      'population': population,
+                      'heuristic': name,
+                      'tasks': tasks,
+                      'offers': n_offers,
+                      'seed': seed,
+                      'seconds': seconds}
+            record.update(quality(bins, skip, targets))
+            yield record
+
+
+def table(records, out):
+    header = '{:<14}{:<12}{:>10}{:>9}{:>7}{:>8}{:>8}{:>8}'
+    row = '{:<14}{:<12}{:>10.4f}{:>9}{:>7}{:>8.3f}{:>8.3f}{:>8.3f}'
+    print(header.format('population', 'heuristic', 'seconds', 'skipped',
+                        'bins', 'cpus', 'mem', 'disk'), file=out)
+    for r in records:
+        u = r['utilisation']
+        print(row.format(r['population'], r['heuristic'], r['seconds'],
+                         r['skipped'], r['bins_used'],
+                         u['cpus'], u['mem'], u['disk']), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--offers', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='best of n runs is reported')
+    parser.add_argument('--heuristic', action='append', dest='heuristics',
+                        help='limit to the given heuristic(s)')
+    parser.add_argument('--population', action='append', dest='populations',
+                        choices=[name for name, _ in POPULATIONS])
+    parser.add_argument('--format', choices=['json', 'table'],
+                        default='json')
+    args = parser.parse_args(argv)
+
+    records = run(args.tasks, args.offers, args.seed, args.repeat,
+                  args.heuristics, args.populations)
+    if args.format == 'table':
+        table(records, sys.stdout)
+    else:
+        for record in records:
+            print(json.dumps(record, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
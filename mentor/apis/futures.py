@@ -1,30 +1,100 @@
 from __future__ import absolute_import, division, print_function
 
 import time
+from collections import deque, namedtuple
+from functools import partial
 
 # TODO: change thrown errors to these
-from concurrent.futures import ALL_COMPLETED, CancelledError, TimeoutError
+from concurrent.futures import (ALL_COMPLETED, FIRST_COMPLETED,
+                                FIRST_EXCEPTION, CancelledError, TimeoutError)
+from six.moves import zip
+from six.moves.queue import Empty, Queue
 
-from ..messages import PythonTask
-from ..scheduler import QueueScheduler, Running
-from ..utils import timeout as seconds
+from ..messages import Function, PythonTask
+from ..scheduler import INTERVAL, QueueScheduler, Running
+from ..utils import TimeoutError as Timeout
+from ..utils import chunks, mapstar
 
 __all__ = ('MesosPoolExecutor',
-           'Future')
+           'Future',
+           'wait',
+           'as_completed')
+
+
+DoneAndNotDoneFutures = namedtuple('DoneAndNotDoneFutures', 'done not_done')
+
+
+def _remaining(deadline):
+    if deadline is None:
+        return None
+    return max(deadline - time.time(), 0)
+
+
+def _next(completed, deadline):
+    # bounded waits, untimed ones can't be interrupted by signals
+    while True:
+        remaining = _remaining(deadline)
+        try:
+            return completed.get(timeout=INTERVAL if remaining is None
+                                 else min(remaining, INTERVAL))
+        except Empty:
+            if remaining is not None and remaining <= INTERVAL:
+                raise
+
+
+def _completion_queue(fs):
+    """Queue receiving the futures in the order they complete"""
+    completed = Queue()
+    for future in fs:
+        future.add_done_callback(completed.put)
+    return completed
 
 
 def wait(fs, timeout=None, return_when=ALL_COMPLETED):
-    raise NotImplementedError()
+    """Waits for the futures to complete
+
+    Returns a (done, not_done) named tuple of sets, return_when is one of
+    FIRST_COMPLETED, FIRST_EXCEPTION or ALL_COMPLETED.
+    """
+    deadline = time.time() + timeout if timeout is not None else None
+    fs = set(fs)
+    done, not_done = set(), set(fs)
+    completed = _completion_queue(fs)
+
+    while not_done:
+        try:
+            future = _next(completed, deadline)
+        except Empty:
+            break
+        done.add(future)
+        not_done.discard(future)
+        if return_when == FIRST_COMPLETED:
+            break
+        if (return_when == FIRST_EXCEPTION and
+                future.status.has_failed() and not future.cancelled()):
+            break
+    return DoneAndNotDoneFutures(done, not_done)
 
 
 def as_completed(fs, timeout=None):
-    raise NotImplementedError()
+    """Yields the futures as they complete, finished or failed"""
+    deadline = time.time() + timeout if timeout is not None else None
+    fs = set(fs)
+    completed = _completion_queue(fs)
+
+    for pending in range(len(fs), 0, -1):
+        try:
+            yield _next(completed, deadline)
+        except Empty:
+            raise Timeout('{} (of {}) futures unfinished'.format(pending,
+                                                                 len(fs)))
 
 
 class Future(object):
 
-    def __init__(self, task):
+    def __init__(self, task, scheduler):
         self.task = task
+        self.scheduler = scheduler
 
     @property
     def status(self):
@@ -42,40 +112,42 @@ class Future(object):
                 self.status.is_staging())
 
     def done(self):
-        return self.status.has_killed() or self.status.has_finished()
+        return self.status.has_terminated()
+
+    def _wait(self, timeout):
+        if not self.scheduler.wait_for(self.task, timeout):
+            raise Timeout('Timed out!')
 
     def result(self, timeout=None):
-        with seconds(timeout):
-            while not self.status.has_terminated():
-                time.sleep(0.1)
-            if self.status.has_finished():
-                return self.status.data
-            else:
-                try:
-                    print(self.status.data)
-                    raise self.status.exception
-                except TypeError:
-                    raise ValueError(
-                        'Future result indicates that task failed!')
+        self._wait(timeout)
+        if self.status.has_finished():
+            return self.status.data
+        else:
+            try:
+                print(self.status.data)
+                raise self.status.exception
+            except TypeError:
+                raise ValueError(
+                    'Future result indicates that task failed!')
 
     def exception(self, timeout=None):
-        with seconds(timeout):
-            while not self.status.has_terminated():
-                time.sleep(0.1)
-            if self.status.has_finished():
-                return None
-            else:
-                return self.status.exception
+        self._wait(timeout)
+        if self.status.has_finished():
+            return None
+        else:
+            return self.status.exception
 
     def add_done_callback(self, fn):
-        raise NotImplementedError()
+        """Calls fn(future) from the status update path once it's done"""
+        self.scheduler.add_callback(self.task, lambda task: fn(self))
 
 
 class MesosPoolExecutor(Running):
 
     def __init__(self, max_workers=-1, *args, **kwargs):
         self.max_worker = max_workers  # TODO
-        self.scheduler = QueueScheduler()
+        # seconds unused offers are held for the upcoming submissions
+        self.scheduler = QueueScheduler(hold=kwargs.pop('hold', None))
         super(MesosPoolExecutor, self).__init__(
             self.scheduler, *args, **kwargs)
 
@@ -83,14 +155,65 @@ class MesosPoolExecutor(Running):
         task = PythonTask(fn=fn, args=args, kwargs=kwargs,
                           name=kwds.pop('name', 'futures'), **kwds)
         self.scheduler.submit(task)
-        return Future(task)
+        return Future(task, self.scheduler)
 
     def map(self, func, *iterables, **kwargs):
+        """Returns an iterator of func applied to the zipped iterables
+
+        Tasks are submitted ahead of the consumer, at most window (default
+        max_workers if positive, otherwise 1000) of them are in flight at
+        once. Every task applies func to chunksize items, the results are
+        yielded in order. Like concurrent.futures, timeout is measured from
+        the call of map.
+        """
         timeout = kwargs.pop('timeout', None)
+        deadline = None if timeout is None else time.time() + timeout
         chunksize = kwargs.pop('chunksize', 1)
-        for item in zip(*iterables):
-            future = self.submit(func, args=item, **kwargs)
-            yield future.result(timeout=timeout)
+        window = kwargs.pop('window', None) or (
+            self.max_worker if self.max_worker > 0 else 1000)
+
+        items = chunks(zip(*iterables), chunksize)
+        pending = deque()
+        chunked = partial(mapstar, func)
+        if kwargs.get('persistent'):  # pickled once for every chunk
+            if chunksize == 1:
+                func = Function.wrap(func)
+            else:
+                chunked = Function.wrap(chunked)
+
+        def fill():
+            while len(pending) < window:
+                chunk = next(items, None)
+                if chunk is None:
+                    return
+                if chunksize == 1:
+                    future = self.submit(func, args=chunk[0], **kwargs)
+                else:
+                    future = self.submit(chunked, args=[chunk], **kwargs)
+                pending.append(future)
+
+        def get(future):
+            if deadline is None:
+                return future.result()
+            remaining = deadline - time.time()
+            if remaining > 0:
+                return future.result(timeout=remaining)
+            elif future.done():  # non positive timeouts would wait forever
+                return future.result()
+            raise Timeout('Timed out!')
+
+        def results():
+            while pending:
+                result = get(pending.popleft())
+                fill()  # keeps the window full while yielding
+                if chunksize == 1:
+                    yield result
+                else:
+                    for value in result:
+                        yield value
+
+        fill()  # submits eagerly, before the first result is requested
+        return results()
 
     def shutdown(self, wait=True):
         if wait:
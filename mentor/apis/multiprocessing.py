@@ -1,21 +1,55 @@
 from __future__ import absolute_import, division, print_function
 
-import time
+from collections import deque
+from functools import partial
 
-from ..messages import PythonTask
+from six.moves import queue
+
+from ..messages import Function, PythonTask
 from ..queue import Queue
-from ..scheduler import QueueScheduler, Running
-from ..utils import timeout
+from ..scheduler import INTERVAL, QueueScheduler, Running
+from ..utils import TimeoutError, chunks, mapstar
 
 __all__ = ('Pool',
            'Queue',
            'AsyncResult')
 
 
+def _get(completed):
+    # bounded waits, untimed ones can't be interrupted by signals
+    while True:
+        try:
+            return completed.get(timeout=INTERVAL)
+        except queue.Empty:
+            pass
+
+
+class Chunk(object):
+    """Results of a chunk task, unpickled once per task status
+
+    Shared by the results of the chunk's items.
+    """
+
+    def __init__(self):
+        self.decoded = (None, None)  # holding (status, values) pair
+
+    def values(self, status):
+        decoded, values = self.decoded
+        if decoded is not status:  # e.g. retried
+            values = status.data
+            self.decoded = (status, values)
+        return values
+
+
 class AsyncResult(object):
 
-    def __init__(self, task):
+    def __init__(self, task, scheduler, index=None, chunk=None):
         self.task = task
+        self.scheduler = scheduler
+        self.index = index  # position of the result in a chunk task's data
+        if index is not None and chunk is None:
+            chunk = Chunk()
+        self.chunk = chunk
 
     @property
     def status(self):
@@ -24,7 +58,9 @@ class AsyncResult(object):
     def get(self, timeout=60):
         self.wait(timeout)
         if self.successful():
-            return self.status.data
+            if self.index is None:
+                return self.status.data
+            return self.chunk.values(self.status)[self.index]
         else:
             try:
                 raise self.status.exception
@@ -32,9 +68,8 @@ class AsyncResult(object):
                 raise ValueError('Async result indicate task failed!')
 
     def wait(self, seconds=60):
-        with timeout(seconds):
-            while not self.ready():
-                time.sleep(0.1)
+        if not self.scheduler.wait_for(self.task, seconds):
+            raise TimeoutError('Timed out!')
 
     def ready(self):
         return self.status.has_terminated()
@@ -47,7 +82,8 @@ class Pool(Running):
 
     def __init__(self, processes=-1, *args, **kwargs):
         self.processes = processes
-        self.scheduler = QueueScheduler()
+        # seconds unused offers are held for the upcoming submissions
+        self.scheduler = QueueScheduler(hold=kwargs.pop('hold', None))
         super(Pool, self).__init__(self.scheduler, *args, **kwargs)
 
     def close(self):
@@ -64,7 +100,87 @@ class Pool(Running):
         return [result.get(timeout=-1) for result in results]
 
     def map_async(self, func, iterable, chunksize=1, callback=None, **kwargs):
-        return [self.apply_async(func, (item,), **kwargs) for item in iterable]
+        results = []
+        for result, size in self._map_chunks(func, iterable, chunksize,
+                                             **kwargs):
+            if size is None:
+                results.append(result)
+            else:  # one view per item of the chunk task
+                chunk = Chunk()
+                results.extend(AsyncResult(result.task, self.scheduler, i,
+                                           chunk) for i in range(size))
+        return results
+
+    def imap(self, func, iterable, chunksize=1, window=None, **kwargs):
+        """Lazy map yielding the results in order
+
+        At most window (default processes if positive, otherwise 1000) tasks
+        of chunksize items are in flight at once.
+        """
+        submitted = self._map_chunks(func, iterable, chunksize, **kwargs)
+        return self._imap(submitted, window or self._window())
+
+    def _imap(self, submitted, window):
+        pending = deque()
+        for chunk in submitted:
+            pending.append(chunk)
+            if len(pending) >= window:
+                for value in self._values(*pending.popleft()):
+                    yield value
+        while pending:
+            for value in self._values(*pending.popleft()):
+                yield value
+
+    def imap_unordered(self, func, iterable, chunksize=1, window=None,
+                       **kwargs):
+        """Lazy map yielding the results as their tasks finish"""
+        submitted = self._map_chunks(func, iterable, chunksize, **kwargs)
+        return self._imap_unordered(submitted, window or self._window())
+
+    def _imap_unordered(self, submitted, window):
+        completed = queue.Queue()
+        inflight = 0
+        for chunk in submitted:
+            result, _ = chunk
+            self.scheduler.add_callback(
+                result.task, lambda task, chunk=chunk: completed.put(chunk))
+            inflight += 1
+            if inflight >= window:
+                for value in self._values(*_get(completed)):
+                    yield value
+                inflight -= 1
+        for _ in range(inflight):
+            for value in self._values(*_get(completed)):
+                yield value
+
+    def _window(self):
+        return self.processes if self.processes > 0 else 1000
+
+    def _map_chunks(self, func, iterable, chunksize, **kwargs):
+        """Lazily submits a task per chunk, yields (result, size) pairs
+
+        Size is None if the task runs func on a single item.
+        """
+        return self._submit_chunks(func, chunks(iterable, chunksize),
+                                   chunksize, **kwargs)
+
+    def _submit_chunks(self, func, items, chunksize, **kwargs):
+        chunked = partial(mapstar, func)
+        if kwargs.get('persistent'):  # pickled once for every chunk
+            if chunksize == 1:
+                func = Function.wrap(func)
+            else:
+                chunked = Function.wrap(chunked)
+        for chunk in items:
+            if chunksize == 1:
+                yield self.apply_async(func, chunk, **kwargs), None
+            else:
+                args = [(item,) for item in chunk]
+                yield self.apply_async(chunked, (args,), **kwargs), len(chunk)
+
+    def _values(self, result, size):
+        value = result.get(timeout=-1)
+        return [value] if size is None else value
 
     def apply(self, func, args=[], kwds={}, **kwargs):
         result = self.apply_async(func=func, args=args, kwds=kwds, **kwargs)
@@ -74,4 +190,4 @@ class Pool(Running):
         task = PythonTask(name=kwargs.pop('name', 'multiprocessing'),
                           fn=func, args=args, kwargs=kwds, **kwargs)
         self.scheduler.submit(task)
-        return AsyncResult(task)
+        return AsyncResult(task, self.scheduler)
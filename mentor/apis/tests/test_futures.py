@@ -5,8 +5,13 @@ import time
 from collections import Iterator
 
 import pytest
-from mentor.apis.futures import Future, MesosPoolExecutor
-from mentor.proxies.messages import Cpus, Disk, Mem
+import concurrent.futures
+from concurrent.futures import FIRST_COMPLETED, FIRST_EXCEPTION
+from mentor.apis.futures import (Future, MesosPoolExecutor, as_completed,
+                                 wait)
+from mentor.messages import PythonTask, PythonTaskStatus
+from mentor.proxies.messages import Cpus, Disk, Mem, TaskStatus
+from mentor.scheduler import QueueScheduler
 from mentor.utils import RemoteException, TimeoutError, timeout
 
 
@@ -15,6 +20,89 @@ def resources():
     return [Cpus(0.1), Mem(128), Disk(0)]
 
 
+@pytest.fixture
+def pending(mocker, resources):
+    """Futures of submitted tasks, finished via the returned callable"""
+    driver = mocker.Mock()
+    scheduler = QueueScheduler()
+    futures = []
+    for i in range(3):
+        task = PythonTask(fn=sum, args=[range(i)], resources=resources,
+                          retries=1)
+        scheduler.submit(task)
+        futures.append(Future(task, scheduler))
+
+    def update(future, state='TASK_FINISHED'):
+        if state == 'TASK_FINISHED':
+            status = PythonTaskStatus(task_id=future.task.id, state=state,
+                                      data=future.task())
+            scheduler.on_update(driver, status)
+        else:
+            status = TaskStatus(task_id=future.task.id, state=state,
+                                message='failed')
+            with pytest.raises(RuntimeError):  # no retries left
+                scheduler.on_update(driver, status)
+
+    return futures, update
+
+
+def test_add_done_callback(pending):
+    futures, update = pending
+    first, second, _ = futures
+    done = []
+    first.add_done_callback(done.append)
+    assert done == []
+
+    update(first)
+    assert done == [first]
+    assert first.done() and first.result() == 0
+
+    update(second, 'TASK_KILLED')
+    second.add_done_callback(done.append)  # already done, called at once
+    assert done == [first, second]
+
+
+def test_wait_return_when(pending):
+    futures, update = pending
+    first, second, third = futures
+
+    done, not_done = wait(futures, timeout=0.01)
+    assert done == set() and not_done == set(futures)
+
+    update(second)
+    done, not_done = wait(futures, return_when=FIRST_COMPLETED)
+    assert done == {second} and not_done == {first, third}
+
+    update(third, 'TASK_FAILED')
+    done, not_done = wait(futures, timeout=1, return_when=FIRST_EXCEPTION)
+    assert third in done and first in not_done
+
+    update(first)
+    done, not_done = wait(futures)
+    assert done == set(futures) and not_done == set()
+
+
+def test_as_completed(pending):
+    futures, update = pending
+    first, second, third = futures
+    update(third)
+
+    it = as_completed(futures, timeout=0.05)
+    assert next(it) is third
+    update(first)
+    assert next(it) is first
+    with pytest.raises(concurrent.futures.TimeoutError):
+        next(it)
+
+
+def test_future_result_timeout(pending):
+    future = pending[0][0]
+    with pytest.raises(concurrent.futures.TimeoutError):
+        future.result(timeout=0.01)
+    with pytest.raises(TimeoutError):  # mentor's one is a subclass
+        future.exception(timeout=0.01)
+
+
 def test_submit():
     with MesosPoolExecutor(name='futures-pool') as executor:
         future1 = executor.submit(operator.add, [1, 2])
@@ -90,3 +178,65 @@ def test_map(resources):
         assert isinstance(it, Iterator)
         for i, v in enumerate(it):
             assert i + i == v
+
+
+def test_map_submits_ahead_in_chunks(mocker, resources):
+    mocker.patch('mentor.scheduler.MesosSchedulerDriver')
+    executor = MesosPoolExecutor(name='futures-pool', max_workers=2)
+    scheduler = executor.scheduler
+    driver = mocker.Mock()
+    submitted = []
+    eager = []
+
+    def submit(task):
+        QueueScheduler.submit(scheduler, task)
+        submitted.append(task)
+        if eager:
+            finish(task)
+
+    def finish(task):
+        status = PythonTaskStatus(task_id=task.id, state='TASK_FINISHED',
+                                  data=task())
+        scheduler.on_update(driver, status)
+
+    mocker.patch.object(scheduler, 'submit', side_effect=submit)
+    it = executor.map(operator.add, range(10), range(10), chunksize=3,
+                      resources=resources)
+    assert isinstance(it, Iterator)
+    assert len(submitted) == 2  # submitted before consuming, up to the window
+    assert [len(task.data[1][0]) for task in submitted] == [3, 3]
+
+    for task in submitted:
+        finish(task)
+    eager.append(True)
+    assert list(it) == [i + i for i in range(10)]
+    assert len(submitted) == 4
+
+    with pytest.raises(ValueError):
+        executor.map(operator.add, range(10), range(10), chunksize=0)
+    assert len(submitted) == 4
+
+
+def test_map_timeout_from_call(mocker, resources):
+    mocker.patch('mentor.scheduler.MesosSchedulerDriver')
+    executor = MesosPoolExecutor(name='futures-pool')
+    scheduler = executor.scheduler
+    submitted = []
+
+    def submit(task):
+        QueueScheduler.submit(scheduler, task)
+        submitted.append(task)
+
+    mocker.patch.object(scheduler, 'submit', side_effect=submit)
+    it = executor.map(operator.add, range(2), range(2), timeout=0.1,
+                      resources=resources)
+    first = submitted[0]
+    scheduler.on_update(mocker.Mock(), PythonTaskStatus(
+        task_id=first.id, state='TASK_FINISHED', data=first()))
+    time.sleep(0.15)
+
+    assert next(it) == 0  # done, even though the deadline has passed
+    start = time.time()
+    with pytest.raises(concurrent.futures.TimeoutError):
+        next(it)
+    assert time.time() - start < 0.05  # no fresh timeout per result
@@ -5,7 +5,9 @@ import time
 import cloudpickle as cp
 import pytest
 from mentor.apis.multiprocessing import AsyncResult, Pool, Queue
+from mentor.messages import Function, PythonTaskStatus
 from mentor.proxies.messages import Cpus, Disk, Mem
+from mentor.scheduler import QueueScheduler
 from mentor.utils import TimeoutError
 
 
@@ -91,3 +93,89 @@ def test_map(resources):
 
     expected = [i + i for i in range(3)]
     assert results == expected
+
+
+@pytest.fixture
+def pool(mocker):
+    """Pool without a running driver, tasks are finished via finish()"""
+    mocker.patch('mentor.scheduler.MesosSchedulerDriver')
+    pool = Pool(name='test-pool')
+    pool.driver = mocker.Mock()
+    pool.submitted = []
+    pool.lag = False  # first task finishes only when the third is submitted
+
+    def submit(task):
+        QueueScheduler.submit(pool.scheduler, task)
+        pool.submitted.append(task)
+        if pool.lag and len(pool.submitted) == 1:
+            return
+        finish(task)
+        if pool.lag and len(pool.submitted) == 3:
+            finish(pool.submitted[0])
+
+    def finish(task):
+        status = PythonTaskStatus(task_id=task.id, state='TASK_FINISHED',
+                                  data=task())
+        pool.scheduler.on_update(pool.driver, status)
+
+    mocker.patch.object(pool.scheduler, 'submit', side_effect=submit)
+    return pool
+
+
+def test_map_async_chunks(pool, resources):
+    results = pool.map_async(lambda x: x * 2, range(5), chunksize=2,
+                             resources=resources)
+    assert len(pool.submitted) == 3
+    assert all([isinstance(res, AsyncResult) for res in results])
+    assert [res.get(timeout=1) for res in results] == [0, 2, 4, 6, 8]
+
+
+def test_map_async_chunks_decoded_once(pool, resources, mocker):
+    results = pool.map_async(lambda x: x * 2, range(4), chunksize=4,
+                             resources=resources)
+    loads = mocker.spy(cp, 'loads')
+    assert [res.get(timeout=1) for res in results] == [0, 2, 4, 6]
+    assert loads.call_count == 1
+
+
+@pytest.mark.parametrize('chunksize', [1, 2])
+def test_map_persistent_wraps_once(pool, resources, mocker, chunksize):
+    wrap = Function.wrap
+
+    def caching(fn):  # as if the executor had received it before
+        function = wrap(fn)
+        Function.cache[function.digest] = fn
+        return function
+
+    wrapped = mocker.patch.object(Function, 'wrap', side_effect=caching)
+    results = pool.map(lambda x: x * 2, range(5), chunksize=chunksize,
+                       resources=resources, persistent=True)
+    assert results == [0, 2, 4, 6, 8]
+    assert wrapped.call_count == 1
+    functions = set(id(task.function) for task in pool.submitted)
+    assert len(functions) == 1
+
+
+def test_imap(pool, resources):
+    it = pool.imap(lambda x: x * 2, range(6), chunksize=2, window=2,
+                   resources=resources)
+    assert pool.submitted == []  # submits lazily
+    assert next(it) == 0
+    assert len(pool.submitted) == 2
+    assert list(it) == [2, 4, 6, 8, 10]
+    assert len(pool.submitted) == 3
+
+
+@pytest.mark.parametrize('method', ['map', 'map_async', 'imap',
+                                    'imap_unordered'])
+def test_invalid_chunksize(pool, method):
+    with pytest.raises(ValueError):
+        getattr(pool, method)(abs, range(3), chunksize=0)
+    assert pool.submitted == []
+
+
+def test_imap_unordered(pool, resources):
+    pool.lag = True
+    it = pool.imap_unordered(lambda x: x * 2, range(6), chunksize=2,
+                             window=2, resources=resources)
+    assert list(it) == [4, 6, 0, 2, 8, 10]
@@ -1,7 +1,136 @@
 from __future__ import absolute_import, division, print_function
 
+import bisect
+import heapq
+import math
 import operator
 
+from six.moves import range
+
+from .proxies.messages import ResourcesMixin, ResourceVector
+
+RESOURCES = ('cpus', 'mem', 'disk')
+
+
+class _Demand(list):
+    """Scalar resource vector, the range and set resources attached
+
+    The heuristics treat it as a plain list of floats, only the bins look
+    at the discrete (range and set) dimensions.
+    """
+    __slots__ = ('discrete',)
+
+
+def _vector(item):
+    if isinstance(item, ResourcesMixin):  # cached, same order as RESOURCES
+        vector = item.vector
+        demand = _Demand(vector)
+        demand.discrete = vector if vector.discrete else None
+        return demand
+    return [float(getattr(item, attr)) for attr in RESOURCES]
+
+
+def _cached(item):
+    """Resource vector of the item, the proxies' cached one is not copied"""
+    if isinstance(item, ResourcesMixin):
+        return item.vector
+    return ResourceVector(*[float(getattr(item, attr)) for attr in RESOURCES])
+
+
+def _fits(demand, capacity):
+    return all(map(operator.le, demand, capacity))
+
+
+class Bin(object):
+    """Packing target with a running residual capacity
+
+    The residual is updated in place whenever an item is placed, so it never
+    has to be recomputed from the content with proxy arithmetics. Range and
+    set resources (e.g. ports) are tracked as well, an item fits only if its
+    ones are still available in the bin.
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.content = []
+        residual = _vector(target)
+        self.residual = list(residual)
+        self.discrete = getattr(residual, 'discrete', None)
+
+    def fits(self, demand):
+        if not _fits(demand, self.residual):
+            return False
+        discrete = getattr(demand, 'discrete', None)
+        if discrete is None:
+            return True
+        return self.discrete is not None and discrete.fits_discrete(self.discrete)
+
+    def add(self, item, demand):
+        residual = self.residual
+        for j, d in enumerate(demand):
+            residual[j] -= d
+        discrete = getattr(demand, 'discrete', None)
+        if discrete is not None:  # only its discrete dimensions are used
+            self.discrete = self.discrete - discrete
+        self.content.append(item)
+
+    def remains(self, demand):
+        return [r - d for r, d in zip(self.residual, demand)]
+
+
+def _pack(targets):
+    return [Bin(target) for target in targets]
+
+
+def _unpack(bins):
+    return [(b.target, b.content) for b in bins]
+
+
+def _scale(targets, **kwargs):
+    """Static per-resource weights normalized by the total target capacity
+
+    Unlike weight() the normalization is computed once, so the weighted
+    capacity of a bin can be updated incrementally.
+    """
+    weights, units = _units(targets, **kwargs)
+    return [w * u for w, u in zip(weights, units)]
+
+
+def _units(targets, **kwargs):
+    """Per-resource weights and unit lengths of the normalized space
+
+    Every resource is normalized by the total capacity of the targets so
+    cpus, mem and disk are comparable as vector components.
+    """
+    if not len(kwargs):
+        raise ValueError('Missing attribute for weighting items!')
+    weights = [0.0] * len(RESOURCES)
+    units = [0.0] * len(RESOURCES)
+    for attr, w in kwargs.items():
+        i = RESOURCES.index(attr)
+        s = sum(float(getattr(target, attr)) for target in targets)
+        if s:  # s equals to zero, attr wont contribute
+            weights[i], units[i] = w, 1 / s
+    return weights, units
+
+
+def _priority(capacity, scale):
+    return sum(map(operator.mul, capacity, scale))
+
+
+def _weigh(vectors, **kwargs):
+    """weight() counterpart operating on resource vectors"""
+    if not len(kwargs):
+        raise ValueError('Missing attribute for weighting items!')
+    weighted = [0.0] * len(vectors)
+    for attr, w in kwargs.items():
+        i = RESOURCES.index(attr)
+        s = sum(v[i] for v in vectors)
+        if s:  # s equals to zero, attr wont contribute
+            for k, v in enumerate(vectors):
+                weighted[k] += w * (v[i] / s)
+    return weighted
+
 
 def weight(items, **kwargs):
     if not len(kwargs):
@@ -25,19 +154,20 @@ def ff(items, targets):
     This is perhaps the simplest packing heuristic;
     it simply packs items in the next available bin.
 
-    Complexity O(n^2)
+    Complexity O(n*m)
     """
-    bins = [(target, []) for target in targets]
+    bins = _pack(targets)
     skip = []
 
     for item in items:
-        for target, content in bins:
-            if item <= (target - sum(content)):
-                content.append(item)
+        demand = _vector(item)
+        for b in bins:
+            if b.fits(demand):
+                b.add(item, demand)
                 break
         else:
             skip.append(item)
-    return bins, skip
+    return _unpack(bins), skip
 
 
 def ffd(items, targets, **kwargs):
@@ -50,7 +180,7 @@ def ffd(items, targets, **kwargs):
     in having a 'sort'; that is, the items are pre-sorted
     (largest to smallest).
 
-    Complexity O(n^2)
+    Complexity O(n*log(n) + n*m)
     """
     sizes = zip(items, weight(items, **kwargs))
     sizes = sorted(sizes, key=operator.itemgetter(1), reverse=True)
@@ -61,62 +191,75 @@ def ffd(items, targets, **kwargs):
 def mr(items, targets, **kwargs):
     """Max-Rest
 
-    Complexity O(n^2)
+    Complexity O(n*m)
     """
-    bins = [(target, []) for target in targets]
+    bins = _pack(targets)
     skip = []
 
     for item in items:
-        capacities = [target - sum(content) for target, content in bins]
-        weighted = weight(capacities, **kwargs)
-
-        (target, content), capacity, _ = max(zip(bins, capacities, weighted),
-                                             key=operator.itemgetter(2))
-        if item <= capacity:
-            content.append(item)
+        demand = _vector(item)
+        weighted = _weigh([b.residual for b in bins], **kwargs)
+        b, _ = max(zip(bins, weighted), key=operator.itemgetter(1))
+        if b.fits(demand):
+            b.add(item, demand)
         else:
             skip.append(item)
-    return bins, skip
+    return _unpack(bins), skip
 
 
-def mrpq(items, targets):
+def mrpq(items, targets, **kwargs):
     """Max-Rest Priority Queue
 
-    Complexity O(n*log(n))
+    Keeps the bins in a max-heap keyed by their weighted remaining capacity,
+    so the bin with the most room is always on the top. Weights are
+    normalized by the total capacity of the targets.
+
+    Complexity O(n*log(m))
     """
-    raise NotImplementedError()
+    scale = _scale(targets, **kwargs)
+    bins = _pack(targets)
+    skip = []
+
+    heap = [(-_priority(b.residual, scale), i) for i, b in enumerate(bins)]
+    heapq.heapify(heap)
+
+    for item in items:
+        demand = _vector(item)
+        if heap and bins[heap[0][1]].fits(demand):
+            _, i = heap[0]
+            bins[i].add(item, demand)
+            heapq.heapreplace(heap, (-_priority(bins[i].residual, scale), i))
+        else:
+            skip.append(item)
+    return _unpack(bins), skip
 
 
 def bf(items, targets, **kwargs):
     """Best-Fit
 
-    Complexity O(n^2)
+    Complexity O(n*m)
     """
-    bins = [(target, []) for target in targets]
+    bins = _pack(targets)
     skip = []
 
     for item in items:
-        containers = []
-        capacities = []
-        for target, content in bins:
-            capacity = target - sum(content)
-            if item <= capacity:
-                containers.append(content)
-                capacities.append(capacity - item)
-
-        if len(capacities):
-            weighted = zip(containers, weight(capacities, **kwargs))
-            content, _ = min(weighted, key=operator.itemgetter(1))
-            content.append(item)
+        demand = _vector(item)
+        containers = [b for b in bins if b.fits(demand)]
+
+        if len(containers):
+            capacities = [b.remains(demand) for b in containers]
+            weighted = zip(containers, _weigh(capacities, **kwargs))
+            b, _ = min(weighted, key=operator.itemgetter(1))
+            b.add(item, demand)
         else:
             skip.append(item)
-    return bins, skip
+    return _unpack(bins), skip
 
 
 def bfd(items, targets, **kwargs):
     """Best-Fit Decreasing
 
-    Complexity O(n^2)
+    Complexity O(n*log(n) + n*m)
     """
     sizes = zip(items, weight(items, **kwargs))
     sizes = sorted(sizes, key=operator.itemgetter(1), reverse=True)
@@ -124,9 +267,180 @@ def bfd(items, targets, **kwargs):
     return bf(items, targets, **kwargs)
 
 
-def bfh(items, targets):
+def bfh(items, targets, **kwargs):
     """Best-Fit-Heap
 
-    Slightly Improved Complexity
+    Keeps the bins in a list sorted by their weighted remaining capacity.
+    An item can only fit into bins with at least its own weighted size, so
+    the lookup bisects to the first such bin and scans upwards until the
+    item actually fits in every resource. Weights are normalized by the
+    total capacity of the targets.
+
+    Complexity O(n*log(m)) on average, O(n*m) in the worst case
+    """
+    return _bfh(items, [_cached(item) for item in items], targets, **kwargs)
+
+
+def _bfh(items, demands, targets, **kwargs):
+    scale = _scale(targets, **kwargs)
+    bins = _pack(targets)
+    skip = []
+
+    index = sorted((_priority(b.residual, scale), i)
+                   for i, b in enumerate(bins))
+
+    # bins unable to hold even the smallest demand are dropped from the index
+    low = [min(map(operator.attrgetter(attr), demands)) if demands else 0
+           for attr in RESOURCES]
+    # residuals only ever shrink, so an item at least as large as one that
+    # has already been skipped is skipped without scanning the bins
+    failed = []
+
+    # the hot loop is inlined for the three RESOURCES dimensions
+    s0, s1, s2 = scale
+    bisect_left, insort = bisect.bisect_left, bisect.insort
+    for item, demand in zip(items, demands):
+        d0, d1, d2 = demand.cpus, demand.mem, demand.disk
+        for f0, f1, f2 in failed:
+            if f0 <= d0 and f1 <= d1 and f2 <= d2:
+                break
+        else:
+            f0 = None
+        if f0 is not None:
+            skip.append(item)
+            continue
+
+        start = bisect_left(index, (d0 * s0 + d1 * s1 + d2 * s2, -1))
+        discrete = demand if demand.ranges or demand.sets else None
+        for pos in range(start, len(index)):
+            b = bins[index[pos][1]]
+            r = b.residual
+            if d0 <= r[0] and d1 <= r[1] and d2 <= r[2] and (
+                    discrete is None or (b.discrete is not None and
+                                         discrete.fits_discrete(b.discrete))):
+                break
+        else:
+            skip.append(item)
+            if discrete is None:  # keeping the smallest skipped demands only
+                failed = [f for f in failed if not (
+                    d0 <= f[0] and d1 <= f[1] and d2 <= f[2])]
+                failed.append((d0, d1, d2))
+            continue
+
+        _, i = index.pop(pos)
+        r[0] -= d0
+        r[1] -= d1
+        r[2] -= d2
+        if discrete is not None:  # only its discrete dimensions are used
+            b.discrete = b.discrete - discrete
+        b.content.append(item)
+        if low[0] <= r[0] and low[1] <= r[1] and low[2] <= r[2]:
+            insort(index, (r[0] * s0 + r[1] * s1 + r[2] * s2, i))
+    return _unpack(bins), skip
+
+
+def bfhd(items, targets, **kwargs):
+    """Best-Fit-Heap Decreasing
+
+    Drop-in replacement of bfd.
+
+    Complexity O(n*log(n) + n*log(m)) on average
+    """
+    if not len(kwargs):
+        raise ValueError('Missing attribute for weighting items!')
+    items = list(items)
+    demands = [_cached(item) for item in items]
+    # weight() over the cached vectors instead of the proxies
+    sizes = [0.0] * len(demands)
+    for attr, w in kwargs.items():
+        values = list(map(operator.attrgetter(attr), demands))
+        s = sum(values)
+        if s:  # s equals to zero, attr wont contribute
+            for k, v in enumerate(values):
+                sizes[k] += w * (v / s)
+    order = sorted(range(len(demands)), key=sizes.__getitem__, reverse=True)
+    return _bfh([items[k] for k in order], [demands[k] for k in order],
+                targets, **kwargs)
+
+
+def dp(items, targets, **kwargs):
+    """Dot-Product
+
+    Vector packing heuristic, places every item into the fitting bin whose
+    normalized residual capacity is the most aligned with the item's
+    normalized demand, i.e. the weighted dot product of the two vectors is
+    the largest. Prefers bins with plenty of the resources the item needs
+    most, so scarce resources don't get stranded.
+
+    Complexity O(n*m)
+    """
+    weights, units = _units(targets, **kwargs)
+    bins = _pack(targets)
+    skip = []
+
+    for item in items:
+        demand = _vector(item)
+        scaled = [w * d * u * u for w, d, u in zip(weights, demand, units)]
+        best, score = None, None
+        for b in bins:
+            if b.fits(demand):
+                dot = sum(s * r for s, r in zip(scaled, b.residual))
+                if score is None or dot > score:
+                    best, score = b, dot
+        if best is None:
+            skip.append(item)
+        else:
+            best.add(item, demand)
+    return _unpack(bins), skip
+
+
+def dpd(items, targets, **kwargs):
+    """Dot-Product Decreasing
+
+    Complexity O(n*log(n) + n*m)
+    """
+    sizes = zip(items, weight(items, **kwargs))
+    sizes = sorted(sizes, key=operator.itemgetter(1), reverse=True)
+    items = map(operator.itemgetter(0), sizes)
+    return dp(items, targets, **kwargs)
+
+
+def l2(items, targets, **kwargs):
+    """L2-Norm Best-Fit
+
+    Vector packing heuristic, places every item into the fitting bin which
+    minimizes the weighted euclidean norm of the normalized residual left
+    after the placement. Unlike the scalar best-fit it penalizes leftovers
+    concentrated in a single resource, so residual capacities stay balanced.
+
+    Complexity O(n*m)
     """
-    raise NotImplementedError()
+    weights, units = _units(targets, **kwargs)
+    bins = _pack(targets)
+    skip = []
+
+    for item in items:
+        demand = _vector(item)
+        best, score = None, None
+        for b in bins:
+            if b.fits(demand):
+                norm = math.sqrt(sum(w * (c * u) ** 2 for w, c, u in
+                                     zip(weights, b.remains(demand), units)))
+                if score is None or norm < score:
+                    best, score = b, norm
+        if best is None:
+            skip.append(item)
+        else:
+            best.add(item, demand)
+    return _unpack(bins), skip
+
+
+def l2d(items, targets, **kwargs):
+    """L2-Norm Best-Fit Decreasing
+
+    Complexity O(n*log(n) + n*m)
+    """
+    sizes = zip(items, weight(items, **kwargs))
+    sizes = sorted(sizes, key=operator.itemgetter(1), reverse=True)
+    items = map(operator.itemgetter(0), sizes)
+    return l2(items, targets, **kwargs)
@@ -0,0 +1,189 @@
+"""Vectorized bin-packing engine
+
+Projects the items and targets to dense (n, k) float arrays of their scalar
+resources, runs the heuristics as vectorized residual updates, then maps
+the assignments back to the original objects. The functions mirror the
+pure-Python ones in mentor.binpack (which remain the fallback when NumPy
+isn't available) and return the same (bins, skip) pair. Range and set
+resources (e.g. ports) are only supported by the pure-Python heuristics,
+items demanding any of them are packed by those instead.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+from functools import wraps
+
+import numpy as np
+
+from . import binpack
+from .binpack import RESOURCES
+from .proxies.messages import ScalarResource
+
+
+def names(objs):
+    """Scalar resource names of the objects, cpus, mem and disk first"""
+    result = list(RESOURCES)
+    for obj in objs:
+        for res in obj.resources:
+            if isinstance(res, ScalarResource):
+                name = res.get('name') or res.proto.name
+                if name and name not in result:
+                    result.append(name)
+    return result
+
+
+def resources(objs, names=RESOURCES):
+    """Projects the objects' scalar resources to an (n, k) float array"""
+    index = {name: j for j, name in enumerate(names)}
+    arr = np.zeros((len(objs), len(names)), dtype=float)
+    for i, obj in enumerate(objs):
+        for res in obj.resources:
+            if isinstance(res, ScalarResource):
+                j = index.get(res.get('name') or res.proto.name)
+                if j is not None:
+                    arr[i, j] += float(res)
+    return arr
+
+
+def weight(arr, names=RESOURCES, **kwargs):
+    """Array counterpart of mentor.binpack.weight
+
+    Each column is normalized by its sum and the weighted columns are summed
+    up, columns summing to zero don't contribute.
+    """
+    if not len(kwargs):
+        raise ValueError('Missing attribute for weighting items!')
+    w = np.zeros(len(names), dtype=float)
+    for attr, value in kwargs.items():
+        w[names.index(attr)] = value
+    s = arr.sum(axis=0)
+    scale = np.divide(w, s, out=np.zeros_like(w), where=s != 0)
+    return arr.dot(scale)
+
+
+def _discrete(objs):
+    """Whether any of the objects has non-scalar (range or set) resources"""
+    return any(not isinstance(res, ScalarResource)
+               for obj in objs for res in obj.resources)
+
+
+def _fallback(fn):
+    """Delegates to the pure-Python heuristic of the same name
+
+    Used when the items demand range or set resources, which can't be
+    projected to the scalar arrays.
+    """
+    pure = getattr(binpack, fn.__name__)
+
+    @wraps(fn)
+    def wrapper(items, targets, **kwargs):
+        items, targets = list(items), list(targets)
+        if _discrete(items):
+            return pure(items, targets, **kwargs)
+        return fn(items, targets, **kwargs)
+    return wrapper
+
+
+def _project(items, targets):
+    keys = names(items + targets)
+    return keys, resources(items, keys), resources(targets, keys)
+
+
+def _decreasing(demands, keys, **kwargs):
+    # stable sort, equally weighted items keep their original order
+    return np.argsort(-weight(demands, keys, **kwargs), kind='mergesort')
+
+
+def _unproject(items, targets, order, assignment):
+    bins = [(target, []) for target in targets]
+    skip = []
+    for i in order:
+        j = assignment[i]
+        if j < 0:
+            skip.append(items[i])
+        else:
+            bins[j][1].append(items[i])
+    return bins, skip
+
+
+def _first_fit(demands, residual, order):
+    assignment = np.full(len(demands), -1, dtype=int)
+    for i in order:
+        fits = (residual >= demands[i]).all(axis=1)
+        j = fits.argmax()
+        if fits[j]:
+            residual[j] -= demands[i]
+            assignment[i] = j
+    return assignment
+
+
+def _best_fit(demands, residual, order, keys, **kwargs):
+    assignment = np.full(len(demands), -1, dtype=int)
+    for i in order:
+        capacities = residual - demands[i]
+        fits = (capacities >= 0).all(axis=1)
+        candidates = np.flatnonzero(fits)
+        if len(candidates):
+            weighted = weight(capacities[candidates], keys, **kwargs)
+            j = candidates[weighted.argmin()]
+            residual[j] = capacities[j]
+            assignment[i] = j
+    return assignment
+
+
+def _max_rest(demands, residual, order, keys, **kwargs):
+    assignment = np.full(len(demands), -1, dtype=int)
+    for i in order:
+        j = weight(residual, keys, **kwargs).argmax()
+        if (residual[j] >= demands[i]).all():
+            residual[j] -= demands[i]
+            assignment[i] = j
+    return assignment
+
+
+@_fallback
+def ff(items, targets):
+    """Vectorized First-Fit
+
+    Complexity O(n*m) elementwise operations, O(n) Python steps
+    """
+    keys, demands, residual = _project(items, targets)
+    order = np.arange(len(items))
+    assignment = _first_fit(demands, residual, order)
+    return _unproject(items, targets, order, assignment)
+
+
+@_fallback
+def ffd(items, targets, **kwargs):
+    """Vectorized First-Fit Decreasing"""
+    keys, demands, residual = _project(items, targets)
+    order = _decreasing(demands, keys, **kwargs)
+    assignment = _first_fit(demands, residual, order)
+    return _unproject(items, targets, order, assignment)
+
+
+@_fallback
+def mr(items, targets, **kwargs):
+    """Vectorized Max-Rest"""
+    keys, demands, residual = _project(items, targets)
+    order = np.arange(len(items))
+    assignment = _max_rest(demands, residual, order, keys, **kwargs)
+    return _unproject(items, targets, order, assignment)
+
+
+@_fallback
+def bf(items, targets, **kwargs):
+    """Vectorized Best-Fit"""
+    keys, demands, residual = _project(items, targets)
+    order = np.arange(len(items))
+    assignment = _best_fit(demands, residual, order, keys, **kwargs)
+    return _unproject(items, targets, order, assignment)
+
+
+@_fallback
+def bfd(items, targets, **kwargs):
+    """Vectorized Best-Fit Decreasing"""
+    keys, demands, residual = _project(items, targets)
+    order = _decreasing(demands, keys, **kwargs)
+    assignment = _best_fit(demands, residual, order, keys, **kwargs)
+    return _unproject(items, targets, order, assignment)
@@ -1,25 +1,37 @@
 from __future__ import absolute_import, division, print_function
 
+import argparse
 import atexit
 import logging
+import math
+import multiprocessing
+import os
 import signal
 import sys
 import threading
+import time
 import traceback
+from collections import OrderedDict
 from functools import partial
 
+import cloudpickle
 from mesos.interface import mesos_pb2
 from mesos.native import MesosExecutorDriver
 
 from .interface import Executor
-from .messages import PythonTaskStatus
+from .messages import Function, PythonTaskStatus
 from .proxies import ExecutorProxy
 
 
 class Running(object):
 
-    def __init__(self, executor):
-        executor = ExecutorProxy(executor)
+    def __init__(self, executor, sparse=False, lazy=False):
+        """Runs the executor with a Mesos driver
+
+        The sparse and lazy flags select the decoding of the received
+        messages and tasks, see ExecutorProxy.
+        """
+        executor = ExecutorProxy(executor, sparse=sparse, lazy=lazy)
         self.driver = MesosExecutorDriver(executor)
 
         def shutdown(signal, frame):
@@ -54,29 +66,97 @@ class Running(object):
             raise exc_type, exc_value, traceback
 
 
+def outcome(task):
+    """Runs the task or its prepared call, returns its terminal status"""
+    try:
+        logging.info('Executing task...')
+        result = task()
+    except Exception as e:
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        tb = ''.join(traceback.format_tb(exc_traceback))
+        logging.exception('Task errored with {}'.format(e))
+        return dict(state='TASK_FAILED', data=(e, tb), message=e.message)
+    else:
+        return dict(state='TASK_FINISHED', data=result)
+
+
+def start(driver, task):
+    """Reports the task running, returns False if it mustn't be run"""
+    driver.update(PythonTaskStatus(task_id=task.id, state='TASK_RUNNING'))
+    logging.info('Sent TASK_RUNNING status update')
+    return True
+
+
+def run(driver, task, execute=outcome, start=start):
+    """Runs the python task, reports its progress via status updates
+
+    Nothing is run nor sent if start returns False, and no terminal status
+    is sent if execute returns None, e.g. it was killed meanwhile.
+    """
+    status = partial(PythonTaskStatus, task_id=task.id)
+
+    if not start(driver, task):
+        return
+
+    fields = execute(task)
+    if fields is not None:
+        driver.update(status(**fields))
+        logging.info('Sent {} status update'.format(fields['state']))
+
+
+def prepare(task):
+    """Unpickles the task's function and arguments in launch order
+
+    A shipped function gets cached before the tasks referencing it run.
+    Returns the task itself if unpickling fails, its run reports the error.
+    """
+    try:
+        fn, args, kwargs = task.data
+        if isinstance(fn, Function):
+            fn = fn.resolve()
+    except Exception:
+        return task
+    return partial(fn, *args, **kwargs)
+
+
+# seconds between the checks of a forked child while waiting for its outcome
+POLL = 1
+
+
+def forked(task, conn):
+    """Child process side of PersistentExecutor.fork"""
+    # the inherited handlers would stop the parent's driver
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # other threads of the parent might have held the logging locks while
+    # forking, those would never be released in the child
+    logging._lock = threading.RLock()
+    for ref in logging._handlerList:
+        handler = ref()
+        if handler is not None:
+            handler.createLock()
+    conn.send_bytes(cloudpickle.dumps(outcome(task)))
+    conn.close()
+
+
+def receive(conn, child):
+    """Outcome sent by the child, EOFError if it exited without one
+
+    Doesn't rely on the end of file alone, processes started by the task
+    might keep the child's end of the pipe open.
+    """
+    while not conn.poll(POLL):
+        if not child.is_alive() and not conn.poll(0):
+            raise EOFError('Child exited with {}'.format(child.exitcode))
+    return cloudpickle.loads(conn.recv_bytes())
+
+
 class OneOffExecutor(Executor):
 
     def on_launch(self, driver, task):
-        status = partial(PythonTaskStatus, task_id=task.id)
-
         def run_task():
-            driver.update(status(state='TASK_RUNNING'))
-            logging.info('Sent TASK_RUNNING status update')
-
             try:
-                logging.info('Executing task...')
-                result = task()
-            except Exception as e:
-                exc_type, exc_value, exc_traceback = sys.exc_info()
-                tb = ''.join(traceback.format_tb(exc_traceback))
-                logging.exception('Task errored with {}'.format(e))
-                driver.update(status(state='TASK_FAILED',
-                                     data=(e, tb),
-                                     message=e.message))
-                logging.info('Sent TASK_RUNNING status update')
-            else:
-                driver.update(status(state='TASK_FINISHED', data=result))
-                logging.info('Sent TASK_FINISHED status update')
+                run(driver, task)
             finally:
                 # stopper = threading.Timer(1.0, driver.stop)
                 # stopper.start()
@@ -92,7 +172,235 @@ class OneOffExecutor(Executor):
         driver.stop()
 
 
+def kill(child):
+    # SIGTERM could hit the handlers inherited from the executor
+    if child.pid is None:  # not started yet
+        return
+    try:
+        os.kill(child.pid, signal.SIGKILL)
+    except OSError:  # already exited
+        pass
+
+
+class PersistentExecutor(Executor):
+
+    def __init__(self, idle_timeout=60, workers=None, processes=False):
+        """Long-lived executor running many tasks in the same process
+
+        Tasks launched with the same executor id on an agent are run
+        concurrently on worker threads, so the interpreter start-up and the
+        imports are paid once. The executor stops after being idle for a
+        while.
+
+        Parameters
+        ----------
+        idle_timeout: float
+            Seconds without running tasks after the executor stops
+        workers: int
+            Number of tasks run concurrently, None runs as many as the total
+            cpus of the launched and not yet terminated tasks (rounded up)
+        processes: bool
+            Run each task in a forked child process of its worker, so
+            CPU-bound tasks don't serialize on the GIL and running tasks can
+            be killed. Otherwise they run on the worker threads and a killed
+            task keeps its worker until it returns.
+        """
+        self.idle_timeout = idle_timeout
+        self.workers = workers
+        self.processes = processes
+        self.running = {}  # holding task_id => task pairs, pending ones too
+        self.pending = OrderedDict()  # holding task_id => task pairs
+        self.active = 0  # number of busy workers
+        self.calls = {}  # holding task_id => prepared call pairs
+        self.children = {}  # holding task_id => child process pairs
+        self.killed = set()
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)  # a task terminated
+        self.timer = None
+
+    def idle(self, driver):
+        """Stops the executor after idle_timeout unless a task is launched"""
+        with self.lock:
+            self._rearm(driver)
+
+    def _rearm(self, driver):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.running:
+            self.timer = threading.Timer(self.idle_timeout, self.expire,
+                                         [driver])
+            self.timer.daemon = True
+            self.timer.start()
+
+    def expire(self, driver):
+        with self.lock:
+            if self.running:
+                return
+        logging.info('Stopping executor idle for {}s'.format(
+            self.idle_timeout))
+        driver.stop()
+
+    def join(self, seconds=None):
+        """Blocks until every launched task has terminated"""
+        deadline = None if seconds is None else time.time() + seconds
+        with self.changed:
+            while self.running:
+                remaining = POLL if deadline is None else min(
+                    deadline - time.time(), POLL)
+                if remaining <= 0:
+                    return False
+                self.changed.wait(remaining)
+        return True
+
+    def capacity(self):
+        """Number of tasks allowed to run at once"""
+        if self.workers:
+            return self.workers
+        # Mesos has allocated the cpus of every launched task
+        cpus = sum(float(task.cpus) for task in self.running.values())
+        return max(int(math.ceil(cpus)), 1)
+
+    def dispatch(self, driver):
+        """Starts the pending tasks the capacity allows, lock held"""
+        capacity = self.capacity()
+        while self.pending and self.active < capacity:
+            _, task = self.pending.popitem(last=False)
+            self.active += 1
+            worker = threading.Thread(target=self.work, args=(driver, task))
+            worker.daemon = True
+            worker.start()
+
+    def release(self, driver, task_id):
+        """Forgets the terminated task, lock held"""
+        self.running.pop(task_id, None)
+        self.pending.pop(task_id, None)
+        self.calls.pop(task_id, None)
+        self.children.pop(task_id, None)
+        self.killed.discard(task_id)
+        self.dispatch(driver)
+        self._rearm(driver)
+        self.changed.notify_all()
+
+    def work(self, driver, task):
+        try:
+            run(driver, task, self.execute, self.start)
+        except Exception:
+            logging.exception('Exception occured during task run!')
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.release(driver, task.id.value)
+
+    def fork(self, task, call):
+        """Runs the call in a child process, None if it has been killed"""
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        child = multiprocessing.Process(target=forked, args=(call, sender))
+        with self.lock:
+            if task.id.value in self.killed:
+                return None
+            self.children[task.id.value] = child
+        # not holding the lock while forking, the child would inherit it
+        child.start()
+        sender.close()
+        with self.lock:
+            if task.id.value in self.killed:  # while starting
+                kill(child)
+
+        try:
+            return receive(receiver, child)
+        except EOFError as e:
+            with self.lock:
+                if task.id.value in self.killed:
+                    return None
+            logging.error('Task {} process died: {}'.format(task.id.value, e))
+            return dict(state='TASK_FAILED', message=str(e))
+        finally:
+            receiver.close()
+            child.join()
+
+    def start(self, driver, task):
+        """Reports the task running unless it has been killed before"""
+        with self.lock:  # a kill is either reported after or seen here
+            if task.id.value in self.killed:
+                return False
+            return start(driver, task)
+
+    def execute(self, task):
+        with self.lock:
+            call = self.calls.pop(task.id.value, task)
+            if task.id.value in self.killed:  # since being started
+                return None
+        if self.processes:
+            fields = self.fork(task, call)
+        else:
+            fields = outcome(call)
+        with self.lock:
+            if task.id.value in self.killed:  # already reported
+                return None
+        return fields
+
+    def on_registered(self, driver, executor, framework, slave):
+        self.idle(driver)
+
+    def on_launch(self, driver, task):
+        task_id = task.id.value
+        # in launch order, so the function cache is populated in time
+        call = prepare(task)
+        with self.lock:
+            self.calls[task_id] = call
+            self.running[task_id] = task
+            self.pending[task_id] = task
+            self.dispatch(driver)
+            self._rearm(driver)
+
+    def on_kill(self, driver, task_id):
+        with self.lock:
+            if task_id.value not in self.running:  # already terminated
+                return
+            self.killed.add(task_id.value)
+            child = self.children.get(task_id.value)
+            if task_id.value in self.pending:  # never started
+                self.release(driver, task_id.value)
+
+        if child is not None:
+            kill(child)  # releases the worker
+        driver.update(PythonTaskStatus(task_id=task_id, state='TASK_KILLED'))
+        logging.info('Sent TASK_KILLED status update')
+
+    def on_shutdown(self, driver):
+        with self.lock:
+            self.pending.clear()
+            children = list(self.children.values())
+        for child in children:
+            kill(child)
+        driver.stop()
+
+
+def parse(argv=None):
+    parser = argparse.ArgumentParser(description='Mentor python executor')
+    parser.add_argument('--persistent', action='store_true',
+                        help='run many tasks until being idle')
+    parser.add_argument('--idle-timeout', type=float, default=60)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='concurrent tasks, defaults to their cpus')
+    parser.add_argument('--processes', action='store_true',
+                        help='run the tasks in child processes')
+    parser.add_argument('--sparse', action='store_true',
+                        help='decode only the set fields of the messages')
+    parser.add_argument('--lazy', action='store_true',
+                        help='decode the fields of the tasks on access')
+    return parser.parse_args(argv)
+
+
 if __name__ == '__main__':
-    status = Running(OneOffExecutor()).run()
+    args = parse()
+    if args.persistent:
+        executor = PersistentExecutor(idle_timeout=args.idle_timeout,
+                                      workers=args.workers,
+                                      processes=args.processes)
+    else:
+        executor = OneOffExecutor()
+    status = Running(executor, sparse=args.sparse, lazy=args.lazy).run()
     code = 0 if status == mesos_pb2.DRIVER_STOPPED else 1
     sys.exit(code)
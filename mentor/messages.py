@@ -1,17 +1,21 @@
 from __future__ import absolute_import, division, print_function
 
+import hashlib
 import logging
+import weakref
+from io import BytesIO
 
 import cloudpickle
 from mesos.interface import mesos_pb2
 
 from .proxies.messages import (CommandInfo, ContainerInfo, Cpus, Disk,
                                DockerInfo, Environment, ExecutorInfo, Mem,
-                               TaskInfo, TaskStatus)
+                               TaskInfo, TaskStatus, encode)
 from .utils import remote_exception
 
 
 class PickleMixin(object):
+    __slots__ = ()
 
     @property
     def data(self):
@@ -23,6 +27,7 @@ class PickleMixin(object):
 
 
 class PythonTaskStatus(PickleMixin, TaskStatus):
+    __slots__ = ()
 
     proto = mesos_pb2.TaskStatus(
         labels=mesos_pb2.Labels(
@@ -40,6 +45,56 @@ class PythonTaskStatus(PickleMixin, TaskStatus):
             return None
 
 
+class FunctionCacheMiss(Exception):
+    pass
+
+
+class Function(object):
+    """Reference of a function by the hash of its pickle
+
+    Carries the pickled function only until it's cached by the executor
+    process, afterwards the tasks ship the digest alone.
+    """
+    cache = {}  # holding digest => function pairs of this process
+    # holding digest => Function pairs, identical pickles share the payload
+    wrapped = weakref.WeakValueDictionary()
+
+    def __init__(self, digest, payload=None):
+        self.digest = digest
+        self.payload = payload  # pickled function, None for references
+
+    @classmethod
+    def wrap(cls, fn):
+        """Pickles and hashes the function
+
+        Pickled on every call, a closure's state might have changed since.
+        Tasks sharing a function can be given the same wrapped instance
+        instead, see PythonTask.
+        """
+        payload = cloudpickle.dumps(fn)
+        digest = hashlib.sha1(payload).hexdigest()
+        function = cls.wrapped.get(digest)
+        if function is None:
+            function = cls.wrapped[digest] = cls(digest, payload)
+        return function
+
+    def reference(self):
+        return Function(self.digest)
+
+    def resolve(self):
+        try:
+            return self.cache[self.digest]
+        except KeyError:
+            if self.payload is None:
+                raise FunctionCacheMiss('Function {} is not cached by the '
+                                        'executor'.format(self.digest))
+        fn = self.cache[self.digest] = cloudpickle.loads(self.payload)
+        return fn
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+
 class PythonTask(PickleMixin, TaskInfo):
 
     proto = mesos_pb2.TaskInfo(
@@ -50,14 +105,21 @@ class PythonTask(PickleMixin, TaskInfo):
                  resources=[Cpus(0.1), Mem(128), Disk(0)],
                  command='python -m mentor.executor', envs={}, uris=[],
                  docker='daskos/mentor:latest', force_pull=False, retries=3,
-                 **kwds):
+                 persistent=False, executor_id=None, **kwds):
         super(PythonTask, self).__init__(**kwds)
         self.status = PythonTaskStatus(task_id=self.id, state='TASK_STAGING')
         self.executor = ExecutorInfo(
             container=ContainerInfo(type='DOCKER',
                                     docker=DockerInfo(network='HOST')),
             command=CommandInfo(shell=True))
+        if persistent and fn is not None:
+            # the executor caches the function, see QueueScheduler.ship
+            if not isinstance(fn, Function):  # unless wrapped beforehand
+                fn = Function.wrap(fn)
+            self.function = fn
+            fn = self.function.reference()
         self.data = (fn, args, kwargs)
+        self.shared = False  # executor id derived from the runtime
         self.envs = envs
         self.uris = uris
         self.docker = docker
@@ -66,6 +128,48 @@ class PythonTask(PickleMixin, TaskInfo):
         self.resources = resources
         self.retries = retries
         self.attempt = 1
+        if persistent:
+            self.command = command + ' --persistent'
+        if executor_id is not None:  # pinned
+            self.executor.id = executor_id
+        elif persistent:
+            # same id for the same runtime, so tasks share the executor
+            self.shared = True
+            self.executor.id = self.runtime_id()
+
+    def placement(self):
+        """Identifies the executor cache of the function, None if not shipped
+
+        The scheduler keeps track of the placements the function has been
+        sent to, see ship.
+        """
+        if 'function' not in vars(self):  # not persistent
+            return None
+        return (self.slave_id.value, self.executor.id.value,
+                self.function.digest)
+
+    def ship(self, payload=True):
+        """Includes the function itself or only references it by digest"""
+        stream = BytesIO(self['data'])
+        cloudpickle.load(stream)  # skips the function, keeps the arguments
+        fn = self.function if payload else self.function.reference()
+        self['data'] = cloudpickle.dumps(fn) + stream.read()
+
+    @property
+    def data(self):
+        stream = BytesIO(self['data'])
+        fn = cloudpickle.load(stream)
+        if stream.tell() == len(self['data']):  # the triplet pickled at once
+            return fn
+        args, kwargs = cloudpickle.load(stream)
+        return fn, args, kwargs
+
+    @data.setter
+    def data(self, value):
+        # pickled in two parts, so ship only replaces the function
+        fn, args, kwargs = value
+        self['data'] = (cloudpickle.dumps(fn) +
+                        cloudpickle.dumps((args, kwargs)))
 
     @property
     def uris(self):
@@ -74,6 +178,7 @@ class PythonTask(PickleMixin, TaskInfo):
     @uris.setter
     def uris(self, value):
         self.executor.command.uris = [{'value': v} for v in value]
+        self.rederive()
 
     @property
     def envs(self):
@@ -82,8 +187,9 @@ class PythonTask(PickleMixin, TaskInfo):
 
     @envs.setter
     def envs(self, value):
-        envs = [{'name': k, 'value': v} for k, v in value.items()]
+        envs = [{'name': k, 'value': v} for k, v in sorted(value.items())]
         self.executor.command.environment = Environment(variables=envs)
+        self.rederive()
 
     @property
     def command(self):
@@ -92,6 +198,7 @@ class PythonTask(PickleMixin, TaskInfo):
     @command.setter
     def command(self, value):
         self.executor.command.value = value
+        self.rederive()
 
     @property
     def docker(self):
@@ -100,6 +207,7 @@ class PythonTask(PickleMixin, TaskInfo):
     @docker.setter
     def docker(self, value):
         self.executor.container.docker.image = value
+        self.rederive()
 
     @property
     def force_pull(self):
@@ -108,6 +216,23 @@ class PythonTask(PickleMixin, TaskInfo):
     @force_pull.setter
     def force_pull(self, value):
         self.executor.container.docker.force_pull_image = value
+        self.rederive()
+
+    def rederive(self):
+        """Follows a runtime change with the derived executor id"""
+        if self.get('shared'):
+            self.executor.id = self.runtime_id()
+
+    def runtime_id(self):
+        """Executor id derived from the image, command, environment and uris
+
+        Every field of the executor except its id contributes, Mesos only
+        reuses a running executor for an identical ExecutorInfo.
+        """
+        proto = encode(self.executor)
+        proto.ClearField('executor_id')
+        digest = hashlib.sha1(proto.SerializePartialToString()).hexdigest()
+        return 'mentor-' + digest
 
     def __call__(self):
         fn, args, kwargs = self.data
@@ -149,6 +274,11 @@ class PythonTask(PickleMixin, TaskInfo):
 
         try:
             raise status.exception  # won't retry due to code error in PythonTaskStatus
+        except FunctionCacheMiss:
+            # e.g. the executor has been restarted, send the function again
+            logging.info('Task {} rescheduled due to function cache miss'.format(
+                self.id))
+            status.state = 'TASK_STAGING'
         except KeyError as e:
             # not a code error, e.g. problem during deployment
             self.retry(status)
@@ -1,8 +1,10 @@
 from __future__ import absolute_import, division, print_function
 
 # import base64
+from collections import OrderedDict
 from copy import copy
 from functools import partial
+from keyword import iskeyword
 
 import six
 from google.protobuf.descriptor import FieldDescriptor
@@ -43,15 +45,50 @@ def label_to_enum(field, value):
     return enum_dict[value].number
 
 
-def message_to_container(message, containers):
+# resolution caches, see _candidates, _template, _decoders and the compiled
+# _decoder and _encoder functions
+CANDIDATES_CACHE = {}
+TEMPLATES_CACHE = {}
+DECODERS_CACHE = {}
+COMPILED_DECODERS = {}
+COMPILED_ENCODERS = {}
+
+
+def _candidates(message, containers):
+    """Registry entries which may hold the given type of message
+
+    Class registrations match on type alone, so the scan stops at the first
+    one. Object registrations also have to compare the template's set fields,
+    those are precomputed. Cached per message type and container registry,
+    the cache is rebuilt when the registry grows.
+    """
+    key = (type(message), id(containers))
+    try:
+        registry, size, candidates = CANDIDATES_CACHE[key]
+        if registry is containers and size == len(containers):
+            return candidates
+    except KeyError:
+        pass
+
+    candidates = []
     for msg, cnt in containers:
         if isinstance(msg, type):  # class definition used
             if isinstance(message, msg):
-                return cnt()
+                candidates.append(((), cnt))
+                break
         elif isinstance(message, msg.__class__):  # object definition used
-            if all([getattr(msg, field.name) == getattr(message, field.name)
-                    for field, value in msg.ListFields()]):
-                return cnt()
+            fields = tuple((field.name, value)
+                           for field, value in msg.ListFields())
+            candidates.append((fields, cnt))
+
+    CANDIDATES_CACHE[key] = (containers, len(containers), candidates)
+    return candidates
+
+
+def message_to_container(message, containers):
+    for fields, cnt in _candidates(message, containers):
+        if all([getattr(message, name) == value for name, value in fields]):
+            return cnt()
     return dict()  # fallback to plain dictionary
 
 
@@ -64,72 +101,225 @@ def container_to_message(container, containers):
                 return copy(msg)
 
 
-def protobuf_to_dict(pb, containers=CONTAINER_MAP, converters=TYPE_CALLABLE_MAP):
-    result = message_to_container(pb, containers)
+def _repeated(converter, values):
+    return [converter(value) for value in values]
+
+
+def _decoders(descriptor, containers, converters, lazy=False, sparse=False):
+    """Field name to converter mapping of a message descriptor
 
-    # for field, value in pb.ListFields():  # only non-empty fields
-    for field in pb.DESCRIPTOR.fields:  # empty fields too
-        value = getattr(pb, field.name)
+    Cached per descriptor, container registry, converter map and decoding
+    mode, the latter is inherited by the sub-messages.
+    """
+    key = (descriptor, id(containers), id(converters), lazy, sparse)
+    try:
+        registry, mapping, decoders = DECODERS_CACHE[key]
+        if registry is containers and mapping is converters:
+            return decoders
+    except KeyError:
+        pass
+
+    decoders = OrderedDict()
+    for field in descriptor.fields:  # empty fields too
         if (field.message_type and field.message_type.has_options and
                 field.message_type.GetOptions().map_entry):
             converter = dict
         elif field.type == FieldDescriptor.TYPE_MESSAGE:
             # recursively encode protobuf sub-message
             converter = partial(protobuf_to_dict, containers=containers,
-                                converters=converters)
+                                converters=converters, lazy=lazy,
+                                sparse=sparse)
         elif field.type == FieldDescriptor.TYPE_ENUM:
             converter = partial(enum_to_label, field)
         else:
             converter = converters[field.type]
 
         if field.label == FieldDescriptor.LABEL_REPEATED:
-            converter = partial(map, converter)
+            converter = partial(_repeated, converter)
+
+        decoders[field.name] = converter
+
+    DECODERS_CACHE[key] = (containers, converters, decoders)
+    return decoders
 
-        result[field.name] = converter(value)
 
+def _compile_decoder(descriptor, containers, converters):
+    """Generates a straight-line decoder function of a message type"""
+    namespace = {'new': partial(message_to_container, containers=containers)}
+    lines = ['def decode(pb):',
+             '    result = new(pb)']
+    decoders = _decoders(descriptor, containers, converters)
+    for i, (name, converter) in enumerate(decoders.items()):
+        namespace['c{}'.format(i)] = converter
+        if iskeyword(name):
+            value = 'getattr(pb, {!r})'.format(name)
+        else:
+            value = 'pb.{}'.format(name)
+        lines.append('    result[{!r}] = c{}({})'.format(name, i, value))
+    lines.append('    return result')
+
+    source = '\n'.join(lines)
+    code = compile(source, '<decoder {}>'.format(descriptor.full_name), 'exec')
+    exec(code, namespace)
+    return namespace['decode']
+
+
+def _decoder(descriptor, containers, converters):
+    key = (descriptor, id(containers), id(converters))
+    try:
+        registry, mapping, decoder = COMPILED_DECODERS[key]
+        if registry is containers and mapping is converters:
+            return decoder
+    except KeyError:
+        pass
+
+    decoder = _compile_decoder(descriptor, containers, converters)
+    COMPILED_DECODERS[key] = (containers, converters, decoder)
+    return decoder
+
+
+def protobuf_to_dict(pb, containers=CONTAINER_MAP, converters=TYPE_CALLABLE_MAP,
+                     lazy=False, sparse=False):
+    """Decodes a protobuf message to a dictionary-like container
+
+    By default every field is decoded, the empty ones too. With sparse=True
+    only the set fields are emitted, containers implementing
+    _bind(pb, decoders, fields) (like the message proxies do) still report
+    the default values of the missing ones on attribute access, the message
+    and repeated ones get stored then so they can be modified in place.
+
+    With lazy=True the fields of such containers are only decoded on access,
+    other containers are decoded eagerly. The C level dict fast paths (e.g.
+    dict(result), json.dumps(result) or **result) skip the undecoded fields
+    on Python 2, so don't hand lazy results to code relying on those.
+    """
+    if not (lazy or sparse):
+        # empty fields too
+        return _decoder(pb.DESCRIPTOR, containers, converters)(pb)
+
+    result = message_to_container(pb, containers)
+    bind = getattr(type(result), '_bind', None)
+    if bind is None and not sparse:
+        return _decoder(pb.DESCRIPTOR, containers, converters)(pb)
+
+    decoders = _decoders(pb.DESCRIPTOR, containers, converters, lazy, sparse)
+    fields = pb.ListFields() if sparse else None
+    if bind is not None:
+        names = None if fields is None else tuple(f.name for f, _ in fields)
+        bind(result, pb, decoders, names)
+        if lazy:
+            return result
+
+    for field, value in fields:  # only non-empty fields
+        result[field.name] = decoders[field.name](value)
     return result
 
 
-def dict_to_protobuf(dct, pb=None, containers=CONTAINER_MAP,
-                     converters=REVERSE_TYPE_CALLABLE_MAP, strict=True):
-    default = container_to_message(dct, containers)
-    if pb:
-        if default:
-            pb.MergeFrom(default)
+def _template(container, containers):
+    """Cached container_to_message, rebuilt when the registry grows"""
+    key = (type(container), id(containers))
+    try:
+        registry, size, msg = TEMPLATES_CACHE[key]
+        if registry is containers and size == len(containers):
+            return msg
+    except KeyError:
+        pass
+
+    for msg, cnt in containers:
+        if isinstance(container, cnt):
+            break
     else:
-        pb = default
-    pb = pb if isinstance(pb, Message) else pb()
+        msg = None
+    TEMPLATES_CACHE[key] = (containers, len(containers), msg)
+    return msg
 
-    for k, v in dct.items():
-        try:
-            # TODO silently skip undifened fields
-            field = pb.DESCRIPTOR.fields_by_name[k]
-        except:
-            if not strict:
-                continue
-            else:
-                raise
-        pb_value = getattr(pb, k, None)
-        if field.label == FieldDescriptor.LABEL_REPEATED:
-            for item in v:
-                if field.type == FieldDescriptor.TYPE_MESSAGE:
+
+def _setter(field, containers, converters):
+    """Specialized function assigning a decoded value to a message field
+
+    Sub-messages are encoded with the same strictness as their parent.
+    """
+    name = field.name
+    if field.label == FieldDescriptor.LABEL_REPEATED:
+        if field.type == FieldDescriptor.TYPE_MESSAGE:
+            def setter(pb, value, strict):
+                pb_value = getattr(pb, name)
+                for item in value:
                     dict_to_protobuf(item, pb_value.add(),
-                                     containers, converters)
-                elif field.type == FieldDescriptor.TYPE_ENUM:
-                    pb_value.append(label_to_enum(field, item))
-                else:
-                    pb_value.append(item)
-        elif field.type == FieldDescriptor.TYPE_MESSAGE:
-            dict_to_protobuf(v, pb_value, containers, converters)
+                                     containers, converters, strict)
+        elif field.type == FieldDescriptor.TYPE_ENUM:
+            def setter(pb, value, strict):
+                getattr(pb, name).extend([label_to_enum(field, item)
+                                          for item in value])
         else:
-            if field.type in converters:
-                v = converters[field.type](v)
-            elif field.type == FieldDescriptor.TYPE_ENUM:
-                v = label_to_enum(field, v)
+            def setter(pb, value, strict):
+                getattr(pb, name).extend(value)
+    elif field.type == FieldDescriptor.TYPE_MESSAGE:
+        def setter(pb, value, strict):
+            dict_to_protobuf(value, getattr(pb, name), containers, converters,
+                             strict)
+    elif field.type in converters:
+        convert = converters[field.type]
+
+        def setter(pb, value, strict):
+            setattr(pb, name, convert(value))
+    elif field.type == FieldDescriptor.TYPE_ENUM:
+        def setter(pb, value, strict):
+            setattr(pb, name, label_to_enum(field, value))
+    else:
+        def setter(pb, value, strict):
+            setattr(pb, name, value)
+    return setter
+
+
+def _compile_encoder(descriptor, containers, converters):
+    """Builds an encoder function of a message type from per-field setters"""
+    setters = {field.name: _setter(field, containers, converters)
+               for field in descriptor.fields}
+
+    def encode(dct, pb, strict):
+        for k, v in dct.items():
+            try:
+                setter = setters[k]
+            except KeyError:
+                # TODO silently skip undifened fields
+                if not strict:
+                    continue
+                else:
+                    raise
+            setter(pb, v, strict)
+        return pb
+
+    return encode
+
 
-            setattr(pb, field.name, v)
+def _encoder(descriptor, containers, converters):
+    key = (descriptor, id(containers), id(converters))
+    try:
+        registry, mapping, encoder = COMPILED_ENCODERS[key]
+        if registry is containers and mapping is converters:
+            return encoder
+    except KeyError:
+        pass
+
+    encoder = _compile_encoder(descriptor, containers, converters)
+    COMPILED_ENCODERS[key] = (containers, converters, encoder)
+    return encoder
+
+
+def dict_to_protobuf(dct, pb=None, containers=CONTAINER_MAP,
+                     converters=REVERSE_TYPE_CALLABLE_MAP, strict=True):
+    template = _template(dct, containers)
+    if pb:
+        # merging an empty message of a class definition is a no-op
+        if template is not None and not isinstance(template, type):
+            pb.MergeFrom(template)
+    elif template is not None:
+        pb = template() if isinstance(template, type) else copy(template)
+    pb = pb if isinstance(pb, Message) else pb()
 
-    return pb
+    encoder = _encoder(pb.DESCRIPTOR, containers, converters)
+    return encoder(dct, pb, strict)
 
 encode = dict_to_protobuf
 decode = protobuf_to_dict
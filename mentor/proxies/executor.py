@@ -2,6 +2,7 @@ from __future__ import absolute_import, division, print_function
 
 import logging
 import sys
+from functools import partial
 
 from mesos.interface import Executor
 
@@ -15,20 +16,25 @@ class ExecutorProxy(Executor):
     methods they don't override.
     """
 
-    def __init__(self, executor):
+    def __init__(self, executor, sparse=False, lazy=False):
         self.executor = executor
+        # sparse decoding emits the set fields only, see protobuf_to_dict
+        self.decode = partial(decode, sparse=sparse)
+        # lazily decoded tasks must not be copied or serialized via the dict
+        # fast paths (dict(task), **task, json), those see them empty
+        self.lazy = lazy
 
     def registered(self, driver, executorInfo, frameworkInfo, slaveInfo):
         logging.info('Registered with slave', extra=dict())
         return self.executor.on_registered(ExecutorDriverProxy(driver),
-                                           decode(executorInfo),
-                                           decode(frameworkInfo),
-                                           decode(slaveInfo))
+                                           self.decode(executorInfo),
+                                           self.decode(frameworkInfo),
+                                           self.decode(slaveInfo))
 
     def reregistered(self, driver, slaveInfo):
         logging.info('Re-registered with slave', extra=dict())
         return self.executor.on_reregistered(ExecutorDriverProxy(driver),
-                                             decode(slaveInfo))
+                                             self.decode(slaveInfo))
 
     def disconnected(self, driver):
         logging.info('Disconnected from slave')
@@ -37,12 +43,12 @@ class ExecutorProxy(Executor):
     def launchTask(self, driver, taskInfo):
         logging.info('Launch task received')
         return self.executor.on_launch(ExecutorDriverProxy(driver),
-                                       decode(taskInfo))
+                                       self.decode(taskInfo, lazy=self.lazy))
 
     def killTask(self, driver, taskId):
         logging.info('Kills task received')
         return self.executor.on_kill(ExecutorDriverProxy(driver),
-                                     decode(taskId))
+                                     self.decode(taskId))
 
     def frameworkMessage(self, driver, message):
         logging.info('Recived framework message', extra=dict())
@@ -1,5 +1,7 @@
 from __future__ import absolute_import, division, print_function
 
+import bisect
+import itertools
 import operator
 from functools import partial
 from uuid import uuid4
@@ -11,6 +13,17 @@ from .. import protobuf
 
 
 class Map(dict):
+    # no per-instance __dict__ for the subclasses declaring __slots__ too,
+    # method binding is only supported by the ones which don't
+    __slots__ = ('_source',)
+
+    def __new__(cls, *args, **kwargs):
+        self = super(Map, cls).__new__(cls)
+        # lazily or sparsely decoded maps keep the wrapped protobuf message,
+        # the field decoders and the names of the fields still to be
+        # decoded, see _bind
+        object.__setattr__(self, '_source', None)
+        return self
 
     def __init__(self, **kwargs):
         for k, v in kwargs.items():
@@ -42,15 +55,145 @@ class Map(dict):
             self[k] = v
 
     def __getattr__(self, k):
-        return self[k]
+        if k.startswith('__'):  # special method lookups e.g. by pickle
+            raise AttributeError(k)
+        elif k == '_source':  # unset slot, e.g. of an unpickled instance
+            return None
+        try:
+            return self[k]
+        except KeyError:
+            source = self._source
+            if source is None or k not in source[1]:
+                raise
+        # default value of a field missing from a sparsely decoded message
+        pb, decoders, _ = source
+        value = decoders[k](getattr(pb, k))
+        if not isinstance(value, (dict, list)):  # immutable scalars
+            return value
+        # stored like the eagerly decoded ones, so writes through it are kept
+        self[k] = value
+        return dict.__getitem__(self, k)
 
     # def __delattr__(self, k):
     #    del self[k]
 
-    # def __missing__(self, k):
-    #    # TODO: consider not using this, silents errors
-    #    self[k] = Map()
-    #    return self[k]
+    def _bind(self, pb, decoders, fields=None):
+        """Wraps a protobuf message, its fields are decoded on first access
+
+        Only the given fields are decoded if any (sparse decoding), the
+        message is kept afterwards to report the defaults of the others.
+        """
+        if fields is None:
+            fields = decoders
+        object.__setattr__(self, '_source', (pb, decoders, fields))
+        for k in decoders:  # drop the defaults set by the constructor
+            dict.pop(self, k, None)
+
+    def _materialize(self):
+        source = self._source
+        if source is None or not source[2]:
+            return
+        pb, decoders, fields = source
+        for k in fields:
+            if not dict.__contains__(self, k):
+                self[k] = decoders[k](getattr(pb, k))
+        source = None if fields is decoders else (pb, decoders, ())
+        object.__setattr__(self, '_source', source)
+
+    def __missing__(self, k):
+        # only called by __getitem__ of lazily decoded fields
+        source = self._source
+        if source is None or k not in source[2]:
+            raise KeyError(k)
+        pb, decoders, _ = source
+        self[k] = decoders[k](getattr(pb, k))
+        # the stored value, __setitem__ might have cast it to a new object
+        return dict.__getitem__(self, k)
+
+    def __contains__(self, k):
+        source = self._source
+        if source is not None and k in source[2]:
+            return True
+        return dict.__contains__(self, k)
+
+    has_key = __contains__
+
+    def get(self, k, default=None):
+        return self[k] if k in self else default
+
+    def __delitem__(self, k):
+        self._materialize()
+        dict.__delitem__(self, k)
+
+    def __len__(self):
+        self._materialize()
+        return dict.__len__(self)
+
+    def __iter__(self):
+        self._materialize()
+        return dict.__iter__(self)
+
+    def keys(self):
+        self._materialize()
+        return dict.keys(self)
+
+    def values(self):
+        self._materialize()
+        return dict.values(self)
+
+    def items(self):
+        self._materialize()
+        return dict.items(self)
+
+    if hasattr(dict, 'iteritems'):  # python 2
+        def iterkeys(self):
+            self._materialize()
+            return dict.iterkeys(self)
+
+        def itervalues(self):
+            self._materialize()
+            return dict.itervalues(self)
+
+        def iteritems(self):
+            self._materialize()
+            return dict.iteritems(self)
+
+    def pop(self, k, *args):
+        self._materialize()
+        return dict.pop(self, k, *args)
+
+    def popitem(self):
+        self._materialize()
+        return dict.popitem(self)
+
+    def setdefault(self, k, default=None):
+        if k in self:
+            return self[k]
+        self[k] = default
+        return self[k]
+
+    def copy(self):
+        self._materialize()
+        return dict.copy(self)
+
+    def __eq__(self, other):
+        self._materialize()
+        if isinstance(other, Map):
+            other._materialize()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        self._materialize()
+        return dict.__repr__(self)
+
+    def __getstate__(self):
+        # the wrapped message and its decoders are not pickled
+        self._materialize()
+        return getattr(self, '__dict__', None)
 
     def __hash__(self):
         return hash(tuple(self.items()))
@@ -71,6 +214,7 @@ class RegisterProxies(type):
 
 
 class MessageProxy(Map):
+    __slots__ = ()
     __metaclass__ = RegisterProxies
     proto = Message
 
@@ -80,16 +224,30 @@ class Environment(MessageProxy):
 
 
 class Scalar(MessageProxy):
+    __slots__ = ()
     proto = mesos_pb2.Value.Scalar
 
 
+class Range(MessageProxy):
+    proto = mesos_pb2.Value.Range
+
+
+class Ranges(MessageProxy):
+    proto = mesos_pb2.Value.Ranges
+
+
+class Set(MessageProxy):
+    proto = mesos_pb2.Value.Set
+
+
 class Resource(MessageProxy):
+    __slots__ = ()
     proto = mesos_pb2.Resource
 
 
-# TODO: RangeResource e.g. ports
 class ScalarResource(Resource):
     # supports comparison and basic arithmetics with scalars
+    __slots__ = ()
     proto = mesos_pb2.Resource(type=mesos_pb2.Value.SCALAR)
 
     def __init__(self, value=None, **kwargs):
@@ -141,35 +299,418 @@ class ScalarResource(Resource):
     def __rtruediv__(self, other):
         return self._op(operator.truediv, other, self)
 
-    def __iadd__(self, other):
-        self.scalar.value = float(self._op(operator.add, self, other))
-        return self
-
-    def __isub__(self, other):
-        self.scalar.value = float(self._op(operator.sub, self, other))
-        return self
+    # no in-place operators, += and -= rebind to a new resource so the
+    # resource lists holding this one and their cached vectors are intact
 
 
 class Cpus(ScalarResource):
+    __slots__ = ()
     proto = mesos_pb2.Resource(name='cpus', type=mesos_pb2.Value.SCALAR)
 
 
 class Mem(ScalarResource):
+    __slots__ = ()
     proto = mesos_pb2.Resource(name='mem', type=mesos_pb2.Value.SCALAR)
 
 
 class Disk(ScalarResource):
+    __slots__ = ()
     proto = mesos_pb2.Resource(name='disk', type=mesos_pb2.Value.SCALAR)
 
 
-class ResourcesMixin(object):
+def _normalize(intervals):
+    """Sorted tuple of disjoint, non-adjacent inclusive integer intervals"""
+    result = []
+    for begin, end in sorted(intervals):
+        if result and begin <= result[-1][1] + 1:
+            if end > result[-1][1]:
+                result[-1] = (result[-1][0], end)
+        else:
+            result.append((begin, end))
+    return tuple(result)
+
+
+def _union(first, second):
+    return _normalize(first + second)
+
+
+def _difference(first, second):
+    """Intervals of the first not covered by the second, both normalized
+
+    Complexity O(n+m)
+    """
+    result = []
+    j = 0
+    for begin, end in first:
+        while j < len(second) and second[j][1] < begin:
+            j += 1
+        k = j
+        while k < len(second) and second[k][0] <= end and begin <= end:
+            if second[k][0] > begin:
+                result.append((begin, second[k][0] - 1))
+            begin = max(begin, second[k][1] + 1)
+            k += 1
+        if begin <= end:
+            result.append((begin, end))
+    return tuple(result)
+
+
+def _covers(first, second):
+    """Whether the second intervals are subsets of the first normalized ones
+
+    Complexity O(m*log(n))
+    """
+    for begin, end in second:
+        i = bisect.bisect_right(first, (begin, float('inf'))) - 1
+        if i < 0 or first[i][1] < end:
+            return False
+    return True
+
+
+def _combine(first, second, op, empty):
+    # name keyed range or set dimensions, None stands for no dimensions
+    if not second:
+        return first
+    result = dict(first or {})
+    for name, value in second.items():
+        result[name] = op(result.get(name, empty), value)
+    return result
+
+
+def _nonempty(dimensions):
+    return {name: value for name, value in (dimensions or {}).items() if value}
+
+
+class RangeResource(Resource):
+    # supports interval arithmetics, e.g. ports
+    __slots__ = ()
+    proto = mesos_pb2.Resource(type=mesos_pb2.Value.RANGES)
+
+    def __init__(self, ranges=None, **kwargs):
+        super(Resource, self).__init__(**kwargs)
+        if ranges is not None:
+            self.ranges = Ranges(range=[Range(begin=begin, end=end)
+                                        for begin, end in _normalize(ranges)])
+
+    @property
+    def intervals(self):
+        return _normalize((rng.begin, rng.end) for rng in self.ranges.range)
+
+    def __repr__(self):
+        return "<{}: {}>".format(self.__class__.__name__, list(self.intervals))
+
+    def _op(self, op, other):
+        if isinstance(other, RangeResource):
+            other = other.intervals
+        return self.__class__(name=self.get('name') or self.proto.name,
+                              ranges=op(self.intervals, _normalize(other)))
+
+    def __add__(self, other):
+        return self._op(_union, other)
+
+    def __sub__(self, other):
+        return self._op(_difference, other)
+
+    def covers(self, other):
+        if isinstance(other, RangeResource):
+            other = other.intervals
+        return _covers(self.intervals, _normalize(other))
+
+
+class SetResource(Resource):
+    # supports set arithmetics, e.g. GPUs by name
+    __slots__ = ()
+    proto = mesos_pb2.Resource(type=mesos_pb2.Value.SET)
+
+    def __init__(self, items=None, **kwargs):
+        super(Resource, self).__init__(**kwargs)
+        if items is not None:
+            self.set = Set(item=sorted(items))
+
+    @property
+    def elements(self):
+        return frozenset(self.set.item)
+
+    def __repr__(self):
+        return "<{}: {}>".format(self.__class__.__name__,
+                                 sorted(self.elements))
+
+    def _op(self, op, other):
+        if isinstance(other, SetResource):
+            other = other.elements
+        return self.__class__(name=self.get('name') or self.proto.name,
+                              items=op(self.elements, frozenset(other)))
+
+    def __add__(self, other):
+        return self._op(operator.or_, other)
+
+    def __sub__(self, other):
+        return self._op(operator.sub, other)
+
+    def covers(self, other):
+        if isinstance(other, SetResource):
+            other = other.elements
+        return self.elements >= frozenset(other)
+
+
+class Ports(RangeResource):
+    __slots__ = ()
+    proto = mesos_pb2.Resource(name='ports', type=mesos_pb2.Value.RANGES)
+
+
+class ResourceVector(object):
+    """Fixed size float vector of the scalar resources keyed by name
+
+    Lightweight value type for the resource arithmetics and comparisons in
+    scheduling loops, the in-place operators don't allocate at all. Range
+    and set resources are carried along as name keyed normalized intervals
+    and frozensets; fitting into another vector requires them to be subsets
+    of the other's.
+    """
+    __slots__ = ('cpus', 'mem', 'disk', 'ranges', 'sets')
+    scalars = ('cpus', 'mem', 'disk')
+
+    def __init__(self, cpus=0.0, mem=0.0, disk=0.0, ranges=None, sets=None):
+        self.cpus = float(cpus)
+        self.mem = float(mem)
+        self.disk = float(disk)
+        self.ranges = ranges
+        self.sets = sets
 
     @classmethod
-    def _cast_zero(cls, other=0):
-        if other == 0:
-            return cls(resources=[Cpus(0), Mem(0), Disk(0)])
-        else:
+    def from_resources(cls, resources):
+        # unlike the proxy properties, sums up every matching resource
+        vector = cls()
+        for res in resources:
+            if isinstance(res, ScalarResource):
+                try:  # skips the attribute lookups of float(res)
+                    value = float(res['scalar']['value'])
+                except KeyError:  # e.g. sparsely decoded
+                    value = float(res)
+                if isinstance(res, Cpus):
+                    vector.cpus += value
+                elif isinstance(res, Mem):
+                    vector.mem += value
+                elif isinstance(res, Disk):
+                    vector.disk += value
+            elif isinstance(res, RangeResource):
+                name = res.get('name') or res.proto.name
+                vector.ranges = _combine(vector.ranges,
+                                         {name: res.intervals}, _union, ())
+            elif isinstance(res, SetResource):
+                name = res.get('name') or res.proto.name
+                vector.sets = _combine(vector.sets, {name: res.elements},
+                                       operator.or_, frozenset())
+        return vector
+
+    @classmethod
+    def cast(cls, other):
+        if isinstance(other, ResourceVector):
             return other
+        elif isinstance(other, ResourcesMixin):
+            return other.vector
+        elif other == 0:
+            return cls()
+        else:
+            raise TypeError('Unsupported operand: {!r}'.format(other))
+
+    def __iter__(self):  # scalars only
+        yield self.cpus
+        yield self.mem
+        yield self.disk
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def __len__(self):
+        return len(self.scalars)
+
+    def __repr__(self):
+        discrete = ''.join(', {}={}'.format(name, value) for name, value in
+                           sorted(_nonempty(self.ranges).items()) +
+                           sorted(_nonempty(self.sets).items()))
+        return '<{}: cpus={}, mem={}, disk={}{}>'.format(
+            self.__class__.__name__, self.cpus, self.mem, self.disk, discrete)
+
+    def __eq__(self, other):
+        if not isinstance(other, ResourceVector):
+            return NotImplemented
+        return (self.cpus == other.cpus and self.mem == other.mem and
+                self.disk == other.disk and
+                _nonempty(self.ranges) == _nonempty(other.ranges) and
+                _nonempty(self.sets) == _nonempty(other.sets))
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None  # mutable
+
+    @property
+    def discrete(self):
+        """Whether there are any range or set resources"""
+        return bool(self.ranges or self.sets)
+
+    def fits_discrete(self, other):
+        """Whether the range and set resources are subsets of the other's"""
+        for name, intervals in (self.ranges or {}).items():
+            if intervals and not _covers((other.ranges or {}).get(name, ()),
+                                         intervals):
+                return False
+        for name, elements in (self.sets or {}).items():
+            if not elements <= (other.sets or {}).get(name, frozenset()):
+                return False
+        return True
+
+    def fits(self, other):
+        """Whether every resource is less than or equal to the other's"""
+        other = self.cast(other)
+        return (self.cpus <= other.cpus and self.mem <= other.mem and
+                self.disk <= other.disk and
+                (not self.discrete or self.fits_discrete(other)))
+
+    def __cmp__(self, other):
+        # same partial ordering as the one of the resources mixin
+        other = self.cast(other)
+        if self.discrete and not self.fits_discrete(other):
+            return 1
+        elif (self.cpus < other.cpus and self.mem < other.mem and
+                self.disk < other.disk):
+            return -1
+        elif (self.cpus > other.cpus or self.mem > other.mem or
+              self.disk > other.disk):
+            return 1
+        else:
+            return 0
+
+    def copy(self):
+        # the range and set dimensions are replaced, never modified in place
+        return ResourceVector(self.cpus, self.mem, self.disk,
+                              self.ranges, self.sets)
+
+    def __add__(self, other):
+        return self.copy().__iadd__(other)
+
+    __radd__ = __add__  # to support sum()
+
+    def __sub__(self, other):
+        return self.copy().__isub__(other)
+
+    def __rsub__(self, other):
+        return self.cast(other).copy().__isub__(self)
+
+    def __iadd__(self, other):
+        other = self.cast(other)
+        self.cpus += other.cpus
+        self.mem += other.mem
+        self.disk += other.disk
+        if other.discrete:
+            self.ranges = _combine(self.ranges, other.ranges, _union, ())
+            self.sets = _combine(self.sets, other.sets, operator.or_,
+                                 frozenset())
+        return self
+
+    def __isub__(self, other):
+        other = self.cast(other)
+        self.cpus -= other.cpus
+        self.mem -= other.mem
+        self.disk -= other.disk
+        if other.discrete:
+            self.ranges = _combine(self.ranges, other.ranges, _difference,
+                                   ())
+            self.sets = _combine(self.sets, other.sets, operator.sub,
+                                 frozenset())
+        return self
+
+
+_versions = itertools.count()  # next() is atomic, unlike += on a global
+
+
+class Resources(list):
+    """List of resources versioned by its in-place changes
+
+    The cached resource vector of the message holding the list is dropped
+    whenever the list gets modified in place.
+    """
+    __slots__ = ('version',)
+
+    def __init__(self, *args):
+        super(Resources, self).__init__(*args)
+        self.version = next(_versions)
+
+    def __reduce__(self):
+        return Resources, (list(self),)
+
+
+def _mutating(method):
+    def mutate(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self.version = next(_versions)
+        return result
+    mutate.__name__ = method.__name__
+    mutate.__doc__ = method.__doc__
+    return mutate
+
+
+for name in ('__setitem__', '__delitem__', '__setslice__', '__delslice__',
+             '__iadd__', '__imul__', 'append', 'extend', 'insert', 'pop',
+             'remove', 'reverse', 'sort'):
+    if hasattr(list, name):
+        setattr(Resources, name, _mutating(getattr(list, name)))
+del name
+
+
+class ResourcesMixin(object):
+    # subclasses have to provide a _vector slot caching the resource vector
+    __slots__ = ()
+
+    def __new__(cls, *args, **kwargs):
+        self = super(ResourcesMixin, cls).__new__(cls, *args, **kwargs)
+        object.__setattr__(self, '_vector', None)  # raising is slow
+        return self
+
+    def __setitem__(self, k, v):
+        if k == 'resources':  # tracks the in-place changes of the list
+            v = v if isinstance(v, Resources) else Resources(map(Map.cast, v))
+            dict.__setitem__(self, k, v)
+        else:
+            super(ResourcesMixin, self).__setitem__(k, v)
+
+    @classmethod
+    def _from_vector(cls, vector):
+        resources = [Cpus(vector.cpus), Disk(vector.disk), Mem(vector.mem)]
+        for name, intervals in sorted((vector.ranges or {}).items()):
+            if name == Ports.proto.name:
+                resources.append(Ports(ranges=intervals))
+            else:
+                resources.append(RangeResource(name=name, ranges=intervals))
+        for name, elements in sorted((vector.sets or {}).items()):
+            resources.append(SetResource(name=name, items=elements))
+        mixin = cls()
+        mixin.resources = resources
+        return mixin
+
+    @property
+    def vector(self):
+        """Cached ResourceVector of the resources
+
+        Recomputed whenever the resources field gets reassigned or the
+        resource list is modified in place (changing a nested field like
+        res.scalar.value directly isn't tracked). The cached vector is shared
+        so don't modify it in place.
+        """
+        resources = self.resources
+        version = getattr(resources, 'version', None)
+        try:
+            cached = self._vector
+        except (AttributeError, KeyError):  # unset slot, e.g. when unpickled
+            cached = None
+        if (cached is not None and cached[0] is resources and
+                cached[1] == version):
+            return cached[2]
+        vector = ResourceVector.from_resources(resources)
+        object.__setattr__(self, '_vector', (resources, version, vector))
+        return vector
 
     @property
     def cpus(self):
@@ -192,86 +733,62 @@ class ResourcesMixin(object):
                 return res
         return Disk(0.0)
 
-    # @property
-    # def ports(self):
-    #     for res in self.resources:
-    #         if isinstance(res, Ports):
-    #             return [(rng.begin, rng.end) for rng in res.ranges.range]
+    @property
+    def ports(self):
+        for res in self.resources:
+            if isinstance(res, Ports):
+                return res
+        return Ports(ranges=[])
 
     def __repr__(self):
         return '<{}: {}>'.format(self.__class__.__name__,
                                  ', '.join(map(str, self.resources)))
 
     def __cmp__(self, other):
-        other = self._cast_zero(other)
-
-        if all([self.cpus < other.cpus,
-                self.mem < other.mem,
-                self.disk < other.disk]):
-            # all resources are smaller the task will fit into offer
-            return -1
-        elif any([self.cpus > other.cpus,
-                  self.mem > other.mem,
-                  self.disk > other.disk]):
-            # any resources is bigger task won't fit into offer
-            return 1
-        else:
-            return 0
+        # all resources are smaller the task will fit into offer,
+        # any resources is bigger task won't fit into offer
+        return self.vector.__cmp__(other)
 
     def __radd__(self, other):  # to support sum()
-        other = self._cast_zero(other)
-        return self + other
+        return self._from_vector(self.vector + other)
 
     def __add__(self, other):
-        other = self._cast_zero(other)
-        # ports = list(set(self.ports) | set(other.ports))
-        cpus = self.cpus + other.cpus
-        mem = self.mem + other.mem
-        disk = self.disk + other.disk
-        mixin = self.__class__()
-        mixin.resources = [cpus, disk, mem]
-        return mixin
+        return self._from_vector(self.vector + other)
 
     def __sub__(self, other):
-        other = self._cast_zero(other)
-        # ports = list(set(self.ports) | set(other.ports))
-        cpus = self.cpus - other.cpus
-        mem = self.mem - other.mem
-        disk = self.disk - other.disk
-        mixin = self.__class__()
-        mixin.resources = [cpus, disk, mem]
-        return mixin
+        return self._from_vector(self.vector - other)
 
     def __iadd__(self, other):
-        other = self._cast_zero(other)
-        added = self + other
-        self.resources = added.resources
+        self.resources = (self + other).resources
         return self
 
     def __isub__(self, other):
-        other = self._cast_zero(other)
-        subbed = self - other
-        self.resources = subbed.resources
+        self.resources = (self - other).resources
         return self
 
 
 class FrameworkID(MessageProxy):
+    __slots__ = ()
     proto = mesos_pb2.FrameworkID
 
 
 class SlaveID(MessageProxy):
+    __slots__ = ()
     proto = mesos_pb2.SlaveID
 
 
 class ExecutorID(MessageProxy):
+    __slots__ = ()
     proto = mesos_pb2.ExecutorID
 
 
 class OfferID(MessageProxy):
+    __slots__ = ()
     proto = mesos_pb2.OfferID
 
 
 class TaskID(MessageProxy):
+    __slots__ = ()
     proto = mesos_pb2.TaskID
 
 
@@ -310,6 +827,7 @@ class Filters(MessageProxy):
 
 
 class TaskStatus(MessageProxy):
+    __slots__ = ()
     proto = mesos_pb2.TaskStatus
 
     @property
@@ -349,10 +867,12 @@ class TaskStatus(MessageProxy):
 
 
 class Offer(ResourcesMixin, MessageProxy):  # important order!
+    __slots__ = ('_vector',)
     proto = mesos_pb2.Offer
 
 
 class TaskInfo(ResourcesMixin, MessageProxy):
+    __slots__ = ('_vector',)
     proto = mesos_pb2.TaskInfo
 
     def __init__(self, id=None, **kwargs):
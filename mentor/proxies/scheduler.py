@@ -2,6 +2,7 @@ from __future__ import absolute_import, division, print_function
 
 import logging
 import sys
+from functools import partial
 
 from mesos.interface import Scheduler
 
@@ -10,19 +11,24 @@ from .messages import Filters, decode, encode
 
 class SchedulerProxy(Scheduler):
 
-    def __init__(self, scheduler):
+    def __init__(self, scheduler, sparse=False, lazy=False):
         self.scheduler = scheduler
+        # sparse decoding emits the set fields only, see protobuf_to_dict
+        self.decode = partial(decode, sparse=sparse)
+        # lazily decoded offers must not be copied or serialized via the
+        # dict fast paths (dict(offer), **offer, json), those see them empty
+        self.lazy = lazy
 
     def registered(self, driver, frameworkId, masterInfo):
         logging.info('Registered with master')
         return self.scheduler.on_registered(SchedulerDriverProxy(driver),
-                                            decode(frameworkId),
-                                            decode(masterInfo))
+                                            self.decode(frameworkId),
+                                            self.decode(masterInfo))
 
     def reregistered(self, driver, masterInfo):
         logging.info('Re-registered with master')
         return self.scheduler.on_reregistered(SchedulerDriverProxy(driver),
-                                              decode(masterInfo))
+                                              self.decode(masterInfo))
 
     def disconnected(self, driver):
         logging.info('Disconnected from master')
@@ -30,35 +36,37 @@ class SchedulerProxy(Scheduler):
 
     def resourceOffers(self, driver, offers):
         logging.info('Got {} resource offers'.format(len(offers)))
+        # lazy offers are decoded on access, declined ones are almost free
         return self.scheduler.on_offers(SchedulerDriverProxy(driver),
-                                        map(decode, offers))
+                                        [self.decode(offer, lazy=self.lazy)
+                                         for offer in offers])
 
     def offerRescinded(self, driver, offerId):
         logging.info('Offer {} rescinded'.format(offerId))
         return self.scheduler.on_rescinded(SchedulerDriverProxy(driver),
-                                           decode(offerId))
+                                           self.decode(offerId))
 
     def statusUpdate(self, driver, status):
         logging.debug('Status update received with state {} for task {}'.format(
                       status.state, status.message))
         return self.scheduler.on_update(SchedulerDriverProxy(driver),
-                                        decode(status))
+                                        self.decode(status))
 
     def frameworkMessage(self, driver, executorId, slaveId, message):
         logging.debug('Framework message received')
         return self.scheduler.on_message(SchedulerDriverProxy(driver),
-                                         decode(executorId),
-                                         decode(slaveId),
+                                         self.decode(executorId),
+                                         self.decode(slaveId),
                                          message)
 
     def slaveLost(self, driver, slaveId):
         logging.debug('Slave has been lost, tasks should be rescheduled')
         return self.scheduler.on_slave_lost(SchedulerDriverProxy(driver),
-                                            decode(slaveId))
+                                            self.decode(slaveId))
 
     def executorLost(self, driver, executorId, slaveId, state):
-        executor_id = decode(executorId)
-        slave_id = decode(slaveId)
+        executor_id = self.decode(executorId)
+        slave_id = self.decode(slaveId)
         logging.debug('Executor {} has been lost on {} with status {}'.format(
                       executor_id, slave_id, state))
         return self.scheduler.on_executor_lost(SchedulerDriverProxy(driver),
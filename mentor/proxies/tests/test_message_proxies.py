@@ -1,12 +1,16 @@
 from __future__ import absolute_import, division, print_function
 
+import pickle
+
 import pytest
 from mesos.interface import mesos_pb2
 from mentor.proxies.messages import (CommandInfo, Cpus, Disk, FrameworkID,
                                     FrameworkInfo, Map, Mem, MessageProxy,
-                                    Offer, RegisterProxies, ResourcesMixin,
-                                    ScalarResource, TaskID, TaskInfo,
-                                    TaskStatus, decode, encode)
+                                    Offer, Ports, RangeResource,
+                                    RegisterProxies, ResourcesMixin,
+                                    ResourceVector, ScalarResource,
+                                    SetResource, TaskID,
+                                    TaskInfo, TaskStatus, decode, encode)
 
 
 @pytest.fixture
@@ -161,6 +165,121 @@ def test_decode_framework_info():
     assert isinstance(wrapped.id, FrameworkID)
 
 
+def test_lazy_decode_offer():
+    message = mesos_pb2.Offer(id=mesos_pb2.OfferID(value='offer'),
+                              hostname='localhost')
+    for name, value in [('cpus', 2), ('mem', 128)]:
+        resource = message.resources.add(name=name, type=mesos_pb2.Value.SCALAR)
+        resource.scalar.value = value
+    lazy = decode(message, lazy=True)
+
+    assert isinstance(lazy, Offer)
+    assert dict.__len__(lazy) == 0  # nothing is decoded yet
+    assert 'hostname' in lazy
+    assert lazy.id.value == 'offer'
+    assert isinstance(lazy.id, MessageProxy)
+    assert dict.__len__(lazy) == 1
+    assert lazy.cpus == 2
+    assert lazy.mem == 128
+    assert lazy.disk == 0
+
+    assert lazy == decode(message)
+    assert encode(decode(message, lazy=True)) == encode(decode(message))
+
+
+def test_lazy_decode_stores_fields():
+    message = mesos_pb2.Offer(id=mesos_pb2.OfferID(value='offer'))
+    resource = message.resources.add(name='cpus', type=mesos_pb2.Value.SCALAR)
+    resource.scalar.value = 2
+    message.attributes.add(name='rack', type=mesos_pb2.Value.TEXT)
+    lazy = decode(message, lazy=True)
+
+    lazy.resources.append(Cpus(5))  # on the first access
+    assert lazy.resources is lazy.resources
+    assert lazy.attributes is lazy.attributes
+    assert len(lazy.resources) == 2
+    assert lazy.vector is lazy.vector  # cached
+
+
+def test_lazy_decode_keeps_assigned_values():
+    message = mesos_pb2.TaskStatus(task_id=mesos_pb2.TaskID(value='id'),
+                                   state=mesos_pb2.TASK_RUNNING)
+    lazy = decode(message, lazy=True)
+    lazy.message = 'assigned'
+
+    assert lazy.is_running()
+    assert dict(lazy.items())['message'] == 'assigned'
+    assert lazy.get('missing') is None
+    with pytest.raises(KeyError):
+        lazy['missing']
+
+
+def test_sparse_decode_status():
+    message = mesos_pb2.TaskStatus(task_id=mesos_pb2.TaskID(value='id'),
+                                   state=mesos_pb2.TASK_RUNNING)
+    sparse = decode(message, sparse=True)
+
+    assert isinstance(sparse, TaskStatus)
+    assert set(sparse.keys()) == {'task_id', 'state'}
+    assert sparse.task_id.value == 'id'
+    assert sparse.is_running()
+    # missing scalars are reported as defaults, but not stored
+    assert sparse.message == ''
+    assert sparse.healthy is False
+    assert 'message' not in sparse
+    with pytest.raises(KeyError):
+        sparse['message']
+    with pytest.raises(KeyError):
+        sparse.undefined
+
+
+def test_sparse_decode_stores_defaults():
+    message = mesos_pb2.TaskInfo(name='task',
+                                 task_id=mesos_pb2.TaskID(value='id'))
+    sparse = decode(message, sparse=True)
+
+    assert 'resources' not in sparse
+    sparse.resources.append(Cpus(1))
+    assert len(sparse.resources) == 1
+    assert sparse.resources is sparse.resources
+    sparse.command.value = 'echo'
+    assert sparse.command.value == 'echo'
+    assert 'data' not in sparse
+    assert sparse.data == ''  # scalars aren't stored
+    assert 'data' not in sparse
+
+
+def test_sparse_lazy_decode_offer():
+    message = mesos_pb2.Offer(hostname='localhost')
+    resource = message.resources.add(name='cpus')
+    resource.type = mesos_pb2.Value.SCALAR
+    resource.scalar.value = 3
+    offer = decode(message, lazy=True, sparse=True)
+
+    assert dict.__len__(offer) == 0
+    assert offer.cpus == 3
+    assert offer.mem == 0
+    assert set(offer) == {'hostname', 'resources'}
+    assert offer.url.address.port == 0
+    assert set(offer) == {'hostname', 'resources', 'url'}  # stored default
+    assert offer.resources[0].keys() == decode(resource, sparse=True).keys()
+
+
+@pytest.mark.parametrize('proxy', [TaskID(value='id'),
+                                   TaskStatus(task_id='id', state='TASK_RUNNING'),
+                                   ScalarResource(value=1.5), Cpus(0.5),
+                                   Offer(resources=[Cpus(1), Mem(2)])])
+def test_compact_proxies(proxy):
+    assert not hasattr(proxy, '__dict__')
+    with pytest.raises(AttributeError):
+        proxy.method = lambda: None
+
+    assert pickle.loads(pickle.dumps(proxy, 2)) == proxy
+    decoded = decode(encode(proxy), sparse=True)
+    assert isinstance(decoded, type(proxy))
+    assert encode(decoded) == encode(proxy)
+
+
 def test_scalar_resource_comparison():
     r1 = ScalarResource(value=11.5)
 
@@ -402,3 +521,130 @@ def test_non_strict_encode_task_info():
     assert p.command.value == 'echo 100'
     with pytest.raises(AttributeError):
         p.status
+
+
+def test_resource_vector():
+    v1 = ResourceVector(cpus=1, mem=128)
+    v2 = ResourceVector(cpus=2, mem=256, disk=10)
+
+    assert list(v1) == [1.0, 128.0, 0.0]
+    assert v1['mem'] == 128
+    assert v1 + v2 == ResourceVector(3, 384, 10)
+    assert v2 - v1 == ResourceVector(1, 128, 10)
+    assert sum([v1, v2]) == ResourceVector(3, 384, 10)
+    assert v1.fits(v2)
+    assert not v2.fits(v1)
+    assert v1 <= v2
+    assert v2 > v1
+
+    v = v1.copy()
+    v += v2
+    v -= v1
+    assert v == v2
+    assert v1 == ResourceVector(1, 128)
+
+
+def test_resources_mixin_vector_cached():
+    o = Offer(resources=[Cpus(2), Mem(256), Disk(10), Cpus(1)])
+    t = TaskInfo(resources=[Cpus(0.5), Mem(128)])
+
+    assert o.vector == ResourceVector(3, 256, 10)  # sums every resource
+    assert o.vector is o.vector
+    assert t.vector.fits(o.vector)
+    assert (o - t).vector == ResourceVector(2.5, 128, 10)
+    assert '_vector' not in o  # not a message field
+
+    t.resources = [Cpus(4)]
+    assert t.vector == ResourceVector(cpus=4)
+    assert t > o
+
+
+def test_resources_mixin_vector_mutations():
+    o = Offer(resources=[Cpus(2), Mem(256)])
+    t = TaskInfo(resources=[Cpus(0.5), Mem(128)])
+    assert t <= o
+
+    t.resources.append(Cpus(4))
+    assert t.vector.cpus == 4.5
+    assert not t <= o
+
+    del t.resources[-1]
+    assert t.vector.cpus == 0.5
+
+    t.resources[0] += 2
+    assert t.vector.cpus == 2.5
+    assert not t <= o
+
+    cpus = o.cpus
+    cpus -= 1  # a new resource, the offer's one is intact
+    assert cpus == 1
+    assert o.vector.cpus == 2
+
+    cached = o.vector
+    t.resources.append(Mem(1))
+    assert o.vector is cached  # invalidated per resource list
+
+    o = pickle.loads(pickle.dumps(o))
+    o.resources.append(Cpus(1))
+    assert o.vector.cpus == 3
+
+
+def test_range_resource():
+    ports = Ports([(31005, 31010), (31000, 31002), (31003, 31003)])
+    assert ports.intervals == ((31000, 31003), (31005, 31010))
+
+    rest = ports - [(31001, 31001), (31006, 31007)]
+    assert isinstance(rest, Ports)
+    assert rest.intervals == ((31000, 31000), (31002, 31003),
+                              (31005, 31005), (31008, 31010))
+    assert (rest + [(31001, 31001)]).intervals == ((31000, 31003),
+                                                   (31005, 31005),
+                                                   (31008, 31010))
+    assert ports.covers([(31000, 31001), (31009, 31010)])
+    assert not ports.covers([(31003, 31005)])
+
+    pb = encode(ports)
+    assert pb.name == 'ports'
+    assert pb.type == mesos_pb2.Value.RANGES
+    assert [(r.begin, r.end) for r in pb.ranges.range] == [(31000, 31003),
+                                                           (31005, 31010)]
+    decoded = decode(pb)
+    assert isinstance(decoded, Ports)
+    assert decoded.intervals == ports.intervals
+
+    other = decode(encode(RangeResource(name='other', ranges=[(1, 2)])))
+    assert type(other) is RangeResource
+
+
+def test_set_resource():
+    gpus = SetResource(name='gpus', items=['gpu1', 'gpu0'])
+    assert gpus.elements == {'gpu0', 'gpu1'}
+    assert (gpus - ['gpu0']).elements == {'gpu1'}
+    assert (gpus + ['gpu2']).elements == {'gpu0', 'gpu1', 'gpu2'}
+    assert gpus.covers(['gpu1'])
+    assert not gpus.covers(['gpu2'])
+
+    pb = encode(gpus)
+    assert pb.type == mesos_pb2.Value.SET
+    assert decode(pb).elements == gpus.elements
+
+
+def test_resources_mixin_discrete_resources():
+    o = Offer(resources=[Cpus(2), Mem(256), Ports([(31000, 31009)]),
+                         SetResource(name='gpus', items=['gpu0', 'gpu1'])])
+    t1 = TaskInfo(resources=[Cpus(1), Mem(128), Ports([(31000, 31000)]),
+                             SetResource(name='gpus', items=['gpu0'])])
+    t2 = TaskInfo(resources=[Cpus(1), Mem(128), Ports([(31010, 31010)])])
+
+    assert o.ports.intervals == ((31000, 31009),)
+    assert t1.vector.fits(o)
+    assert t1 <= o
+    assert not t2.vector.fits(o)
+    assert t2 > o
+
+    rest = o - t1
+    assert rest.ports.intervals == ((31001, 31009),)
+    assert rest.vector.sets == {'gpus': {'gpu1'}}
+    assert rest.vector == (o.vector - t1.vector)
+    assert (rest + t1).vector == o.vector
+    assert not t1.vector.fits(rest)
@@ -1,3 +1,5 @@
+import json
+
 from mesos.interface import mesos_pb2
 from mentor.proxies import SchedulerDriverProxy, SchedulerProxy
 from mentor.proxies.messages import (Cpus, ExecutorID, Mem, OfferID, Operation,
@@ -68,3 +70,46 @@ def test_scheduler_driver_callbacks(mocker):
     driver.reviveOffers.assert_called_once()
     driver.suppressOffers.assert_called_once()
     driver.acceptOffers.assert_called_once()
+
+
+def test_scheduler_offers(mocker):
+    sched = mocker.Mock()
+    driver = mocker.Mock()
+    proxy = SchedulerProxy(sched)
+
+    offer = mesos_pb2.Offer(hostname='localhost')
+    proxy.resourceOffers(driver, [offer])
+
+    _, offers = sched.on_offers.call_args[0]
+    assert len(offers) == 1
+    assert offers[0]._source is None
+    # the C fast paths of dict bypass the overridden methods
+    assert dict(offers[0])['hostname'] == 'localhost'
+    assert json.loads(json.dumps(offers[0]))['hostname'] == 'localhost'
+
+
+def test_scheduler_lazy_offers(mocker):
+    sched = mocker.Mock()
+    driver = mocker.Mock()
+    proxy = SchedulerProxy(sched, lazy=True)
+
+    offer = mesos_pb2.Offer(hostname='localhost')
+    proxy.resourceOffers(driver, [offer])
+
+    _, offers = sched.on_offers.call_args[0]
+    assert len(offers) == 1
+    assert offers[0]._source[0] is offer
+    assert offers[0].hostname == 'localhost'
+
+
+def test_scheduler_sparse_decoding(mocker):
+    sched = mocker.Mock()
+    proxy = SchedulerProxy(sched, sparse=True)
+
+    proxy.statusUpdate(mocker.Mock(), mesos_pb2.TaskStatus(
+        task_id=mesos_pb2.TaskID(value='id'), state=mesos_pb2.TASK_FINISHED))
+
+    _, status = sched.on_update.call_args[0]
+    assert set(status.keys()) == {'task_id', 'state'}
+    assert status.has_succeeded()
+    assert status.message == ''
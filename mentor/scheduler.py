@@ -4,25 +4,39 @@ import atexit
 import logging
 import os
 import signal
+import threading
 import time
-from collections import Counter
+from collections import Counter, OrderedDict
+from functools import partial
 
 from mesos.interface import mesos_pb2
 from mesos.native import MesosSchedulerDriver
 
 from .binpack import bfd
 from .interface import Scheduler
+from .messages import PythonTask
 from .proxies import SchedulerProxy
-from .proxies.messages import FrameworkInfo, TaskInfo, encode
-from .utils import timeout
+from .proxies.messages import (Filters, FrameworkInfo, Offer, Operation,
+                               TaskInfo, encode)
+from .utils import TimeoutError
+
+# longest single blocking wait, untimed waits can't be interrupted by signals
+# on python 2 so the handlers installed by Running would never run
+INTERVAL = 1
 
 
 class Running(object):
 
     def __init__(self, scheduler, name, user='', master=os.getenv('MESOS_MASTER'),
-                 implicit_acknowledge=1, *args, **kwargs):
+                 implicit_acknowledge=1, sparse=False, lazy=False, *args,
+                 **kwargs):
+        """Runs the scheduler with a Mesos driver
+
+        The sparse and lazy flags select the decoding of the received
+        messages and offers, see SchedulerProxy.
+        """
         framework = FrameworkInfo(name=name, user=user, *args, **kwargs)
-        scheduler = SchedulerProxy(scheduler)
+        scheduler = SchedulerProxy(scheduler, sparse=sparse, lazy=lazy)
         self.driver = MesosSchedulerDriver(scheduler, encode(framework),
                                            master, implicit_acknowledge)
 
@@ -58,11 +72,90 @@ class Running(object):
             raise exc_type, exc_value, traceback
 
 
+def aggregate(offers):
+    """Groups the offers by agent
+
+    Returns (virtual offer, contributing offers) pairs, the virtual offer
+    holds every resource of the agent's offers so tasks can be packed
+    against their combined capacity.
+    """
+    groups = OrderedDict()
+    for offer in offers:
+        groups.setdefault(offer.slave_id.value, []).append(offer)
+
+    result = []
+    for group in groups.values():
+        if len(group) == 1:
+            result.append((group[0], group))
+        else:
+            first = group[0]
+            # summed resources, so cpus, mem, disk and vector all agree
+            virtual = Offer._from_vector(sum(offer.vector for offer in group))
+            virtual.id = first.id
+            virtual.slave_id = first.slave_id
+            result.append((virtual, group))
+    return result
+
+
 class QueueScheduler(Scheduler):
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, packer=partial(bfd, cpus=1, mem=1), weights=None,
+                 budget=None, batch=1000, aggregate=False, hold=None,
+                 tick=0.1, refuse_seconds=(1, 300), *args, **kwargs):
+        """
+        Parameters
+        ----------
+        packer: callable
+            Binpacking strategy with the (items, targets) -> (bins, skip)
+            contract, e.g. any heuristic from mentor.binpack or
+            mentor.binpack_numpy
+        weights: dict
+            Keyword arguments passed to the packer, e.g. the resource weights
+            of the heuristics accepting them, None passes nothing
+        budget: float
+            Seconds a single offer cycle may spend on packing, the tasks
+            packed until the budget runs out are launched, the rest are kept
+            staging for the next cycle. None means unlimited.
+        batch: int
+            Number of tasks packed at once when a budget is set
+        aggregate: bool
+            Pack against the combined resources of the offers received from
+            the same agent, the tasks are launched using all of them
+        hold: float
+            Seconds an unused offer is kept for the tasks submitted in the
+            meantime before declining it, None declines unused offers
+            immediately
+        tick: float
+            Seconds the tasks submitted while offers are held are batched for
+            before packing them into the held offers at once
+        refuse_seconds: tuple
+            Bounds of the refuse_seconds filter of the declined offers, the
+            fewer tasks are waiting the longer the master won't re-offer the
+            declined resources
+        """
         self.tasks = {}  # holding task_id => task pairs
+        self.events = {}  # holding task_id => termination event pairs
+        self.callbacks = {}  # holding task_id => [done callback] pairs
         self.healthy = True
+        self.packer = partial(packer, **weights) if weights else packer
+        self.budget = budget
+        self.batch = batch
+        self.aggregate = aggregate
+        self.hold = hold
+        self.held = OrderedDict()  # holding offer_id => (offer, expiry) pairs
+        self.driver = None  # the one held offers can be launched with
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)  # a task terminated
+        self.timer = None
+        self.tick = tick
+        self.flusher = None  # packs the batched submits into held offers
+        self.refuse_seconds = refuse_seconds
+        self.suppressed = False
+        self.declined = False  # decline filters set since the last revive
+        # holding (agent, executor, digest) triplets of the functions cached
+        # by the persistent executors, see ship
+        self.shipped = set()
+        self.shipping = {}  # holding task_id => triplet of carrying tasks
 
     @property
     def statuses(self):
@@ -79,51 +172,316 @@ class QueueScheduler(Scheduler):
         logging.info('Task states: {}'.format(message))
 
     def wait(self, seconds=-1):
-        with timeout(seconds):
-            try:
-                while self.healthy and not self.is_idle():
-                    time.sleep(0.1)
-            except (KeyboardInterrupt, SystemExit):
-                raise
+        """Blocks until every task has terminated or the scheduler fails"""
+        deadline = time.time() + seconds if seconds > 0 else None
+        with self.changed:
+            while self.healthy and not self.is_idle():
+                if deadline is None:
+                    self.changed.wait(INTERVAL)
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError('Timed out!')
+                self.changed.wait(min(remaining, INTERVAL))
+
+    def wait_for(self, task, seconds=-1):
+        """Blocks until the task has terminated
+
+        Returns False if it is still running after the given seconds, non
+        positive or None seconds wait forever.
+        """
+        event = self.events.get(task.id)
+        if event is None:  # already terminated
+            return task.status.has_terminated()
+        if seconds is None or seconds <= 0:
+            deadline = None
+        else:
+            deadline = time.time() + seconds
+        while not event.is_set():
+            if deadline is None:
+                event.wait(INTERVAL)
+                continue
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            event.wait(min(remaining, INTERVAL))
+        return True
+
+    def add_callback(self, task, fn):
+        """Calls fn(task) once the task has terminated
+
+        Callbacks are invoked from the status update path, or right away if
+        the task has already terminated.
+        """
+        with self.lock:
+            if task.id in self.events:
+                self.callbacks.setdefault(task.id, []).append(fn)
+                return
+        fn(task)
 
     def submit(self, task):  # supports commandtask, pythontask etc.
         assert isinstance(task, TaskInfo)
-        self.tasks[task.id] = task
+        with self.lock:
+            self.tasks[task.id] = task
+            self.events[task.id] = threading.Event()
+            self.revive(self.driver)
+            if self.held and self.flusher is None:
+                # the tasks submitted within a tick are packed at once
+                self.flusher = threading.Timer(self.tick, self.flush)
+                self.flusher.daemon = True
+                self.flusher.start()
 
-    def on_offers(self, driver, offers):
-        logging.info('Received offers: {}'.format(sum(offers)))
-        self.report()
+    def flush(self):
+        """Packs the staging tasks into the held offers"""
+        with self.lock:
+            self.flusher = None
+            offers = [offer for offer, _ in self.held.values()]
+            if offers:
+                for offer in self.schedule(self.driver, offers,
+                                           self.staging()):
+                    del self.held[offer.id.value]
+
+    def pack(self, tasks, offers):
+        if not self.budget:
+            return self.packer(tasks, offers)
+
+        deadline = time.time() + self.budget
+        bins = [(offer, []) for offer in offers]
+        residuals = list(offers)
+        skip = []
+        for start in range(0, len(tasks), self.batch):
+            if time.time() > deadline:
+                logging.info('Packing budget of {}s exceeded, {} tasks left '
+                             'staging'.format(self.budget, len(tasks) - start))
+                skip.extend(tasks[start:])
+                break
+
+            packed, skipped = self.packer(tasks[start:start + self.batch],
+                                          residuals)
+            index = {id(residual): i for i, residual in enumerate(residuals)}
+            for residual, content in packed:
+                if len(content):
+                    i = index[id(residual)]
+                    bins[i][1].extend(content)
+                    used = sum(task.vector for task in content)
+                    residuals[i] = residual - used
+            skip.extend(skipped)
+        return bins, skip
+
+    def schedule(self, driver, offers, tasks):
+        """Packs the tasks into the offers and launches them
 
-        # maybe limit to the first n tasks
-        staging = [self.tasks[status.task_id]
-                   for status in self.statuses.values() if status.is_staging()]
-        # best-fit-decreasing binpacking
-        bins, skip = bfd(staging, offers, cpus=1, mem=1)
+        Returns the offers used, the unused ones are left untouched.
+        """
+        if self.aggregate:
+            groups = aggregate(offers)
+        else:
+            groups = [(offer, [offer]) for offer in offers]
+        contributing = {id(offer): group for offer, group in groups}
 
+        # best-fit-decreasing binpacking by default
+        bins, skip = self.pack(tasks, [offer for offer, _ in groups])
+
+        used = []
         for offer, tasks in bins:
+            if not len(tasks):
+                continue
+            group = contributing[id(offer)]
+            used.extend(group)
             try:
                 for task in tasks:
                     task.slave_id = offer.slave_id
                     task.status.state = 'TASK_STARTING'
-                # running with empty task list will decline the offer
-                driver.launch(offer.id, tasks)
+                    self.ship(task)
+                if len(group) > 1:
+                    operation = Operation(type='LAUNCH',
+                                          launch={'task_infos': tasks})
+                    driver.accept([o.id for o in group], [operation],
+                                  self.launch_filters())
+                else:
+                    driver.launch(offer.id, tasks, self.launch_filters())
             except Exception:
                 logging.exception('Exception occured during task launch!')
+        return used
+
+    def ship(self, task):
+        """Sends the function of a persistent task unless already cached
+
+        Only counts as cached once a task carrying it is running, until
+        then every task launched to the same executor carries it.
+        """
+        if not isinstance(task, PythonTask):
+            return
+        placement = task.placement()
+        if placement is None:
+            return
+        payload = placement not in self.shipped
+        task.ship(payload)
+        if payload:
+            self.shipping[task.id] = placement
+        else:
+            self.shipping.pop(task.id, None)
+
+    def forget(self, slave_id, executor_id=None):
+        """Drops the functions cached by the lost executors"""
+        self.shipped = {(slave, executor, digest)
+                        for slave, executor, digest in self.shipped
+                        if slave != slave_id.value or (
+                            executor_id is not None and
+                            executor != executor_id.value)}
+
+    def staging(self):
+        return [self.tasks[status.task_id]
+                for status in self.statuses.values() if status.is_staging()]
+
+    def waiting(self):
+        return sum(1 for status in self.statuses.values()
+                   if status.is_staging())
+
+    def launch_filters(self):
+        """Filters of the unused part of the offers tasks are launched on
+
+        While holding offers the remainder is wanted back straight away.
+        """
+        return Filters(refuse_seconds=0) if self.hold else Filters()
+
+    def filters(self):
+        """Adaptive decline filters based on the number of waiting tasks"""
+        shortest, longest = self.refuse_seconds
+        seconds = max(shortest, longest / (1 + self.waiting()))
+        return Filters(refuse_seconds=seconds)
+
+    def decline(self, driver, offers):
+        if not offers:
+            return
+        # accepting without operations declines the offers at once, but all
+        # of them have to belong to the same agent
+        groups = OrderedDict()
+        for offer in offers:
+            groups.setdefault(offer.slave_id.value, []).append(offer)
+
+        filters = self.filters()
+        for group in groups.values():
+            try:
+                driver.accept([offer.id for offer in group], [], filters)
+            except Exception:
+                logging.exception('Exception occured during offer decline!')
+        self.declined = True
+
+    def suppress(self, driver):
+        """Stops receiving offers while there are no tasks to launch"""
+        if driver is not None and not self.suppressed and not self.waiting():
+            logging.info('Suppressing offers')
+            driver.suppress()
+            self.suppressed = True
+
+    def revive(self, driver):
+        """Requests offers again, also clears the decline filters
+
+        Called whenever the queue grows, so new tasks don't have to wait for
+        the refuse_seconds of the offers declined meanwhile.
+        """
+        if driver is not None and (self.suppressed or self.declined):
+            logging.info('Reviving offers')
+            driver.revive()
+            self.suppressed = False
+            self.declined = False
+
+    def expire(self):
+        """Declines the held offers whose holding time is over"""
+        with self.lock:
+            now = time.time()
+            expired = [offer for offer, expiry in self.held.values()
+                       if expiry <= now]
+            for offer in expired:
+                del self.held[offer.id.value]
+            self.decline(self.driver, expired)
+
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.held:
+                first = min(expiry for _, expiry in self.held.values())
+                self.timer = threading.Timer(max(first - now, 0), self.expire)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def on_offers(self, driver, offers):
+        logging.info('Received offers: {}'.format(
+            sum(offer.vector for offer in offers)))
+        self.report()
+
+        with self.lock:
+            self.driver = driver
+            # held offers are reused along with the new ones
+            expiry = time.time() + (self.hold or 0)
+            for offer in offers:
+                self.held[offer.id.value] = (offer, expiry)
+            offers = [offer for offer, _ in self.held.values()]
+
+            # maybe limit to the first n tasks
+            for offer in self.schedule(driver, offers, self.staging()):
+                del self.held[offer.id.value]
+
+            if not self.hold:
+                unused = [offer for offer, _ in self.held.values()]
+                self.held.clear()
+                self.decline(driver, unused)
+            else:
+                self.expire()
+            self.suppress(driver)
+
+    def on_slave_lost(self, driver, slave_id):
+        with self.lock:
+            self.forget(slave_id)
+
+    def on_executor_lost(self, driver, executor_id, slave_id, status):
+        with self.lock:
+            self.forget(slave_id, executor_id)
+
+    def on_rescinded(self, driver, offer_id):
+        with self.lock:
+            self.held.pop(offer_id.value, None)
 
     def on_update(self, driver, status):
         task = self.tasks[status.task_id]
         logging.info('Updated task {} state to {}'.format(status.task_id,
                                                           status.state))
+        with self.lock:
+            if status.is_running() or status.has_terminated():
+                placement = self.shipping.pop(task.id, None)
+                if placement is not None and status.is_running():
+                    self.shipped.add(placement)  # cached by the executor
         try:
             task.update(status)  # creates new task.status in case of retry
         except:
-            self.healthy = False
+            with self.changed:
+                self.healthy = False
+                self.changed.notify_all()
             driver.stop()
             raise
         finally:
             if status.has_terminated():
-                del self.tasks[task.id]
+                with self.changed:
+                    del self.tasks[task.id]
+                    event = self.events.pop(task.id, None)
+                    if event is not None:
+                        event.set()
+                    callbacks = self.callbacks.pop(task.id, [])
+                    self.changed.notify_all()
+                for fn in callbacks:  # outside of the lock
+                    try:
+                        fn(task)
+                    except Exception:
+                        logging.exception('Exception occured in a done '
+                                          'callback of task {}'.format(task.id))
 
+        if task.status.is_staging():  # rescheduled
+            with self.lock:
+                if isinstance(task, PythonTask):
+                    # e.g. the executor has been restarted and lost its cache
+                    self.shipped.discard(task.placement())
+                self.revive(driver)
         self.report()
 
 
@@ -1,8 +1,10 @@
 from __future__ import absolute_import, division, print_function
 
 import pytest
-from mentor.binpack import bf, bfd, ff, ffd, mr, weight
-from mentor.proxies.messages import Cpus, Mem, Offer, TaskInfo
+from mentor.binpack import (Bin, bf, bfd, bfh, bfhd, dp, dpd, ff, ffd, l2, l2d,
+                            mr, mrpq, weight)
+from mentor.proxies.messages import (Cpus, Mem, Offer, Ports, SetResource,
+                                    TaskInfo)
 
 
 @pytest.fixture
@@ -35,6 +37,18 @@ def test_weight(offers):
     assert round(sum(weight(offers, cpus=4, mem=1.5)), 1) == 5.5
 
 
+def test_bin(tasks, offers):
+    b = Bin(offers[0])
+    assert b.residual == [1.1, 2048, 0]
+
+    demand = [float(tasks[1].cpus), float(tasks[1].mem), 0]
+    assert b.fits(demand)
+    b.add(tasks[1], demand)
+    assert b.content == [tasks[1]]
+    assert b.residual == [1.1 - 1.0, 2048 - 256, 0]
+    assert not b.fits(demand)
+
+
 def test_ff(tasks, offers):
     bins, skip = ff(tasks, offers)
     assert skip == [tasks[2]]
@@ -58,3 +72,92 @@ def test_bf(tasks, offers):
 def test_bfd(tasks, offers):
     bins, skip = bfd(tasks, offers, cpus=1, mem=1)
     assert skip == [tasks[2]]
+
+
+def test_mrpq(tasks, offers):
+    bins, skip = mrpq(tasks, offers, cpus=1, mem=1)
+    assert skip == [tasks[2], tasks[4]]
+    for offer, content in bins:
+        assert sum(content) <= offer
+
+    with pytest.raises(ValueError):
+        mrpq(tasks, offers)
+
+
+def test_bfh(tasks, offers):
+    bins, skip = bfh(tasks, offers, cpus=1, mem=1)
+    assert skip == [tasks[2]]
+    for offer, content in bins:
+        assert sum(content) <= offer
+
+
+def test_bfhd(tasks, offers):
+    bins, skip = bfhd(tasks, offers, cpus=1, mem=1)
+    assert skip == [tasks[2]]
+    for offer, content in bins:
+        assert sum(content) <= offer
+
+
+def test_bfh_skipped_demands():
+    offers = [Offer(resources=[Cpus(2), Mem(256)]),
+              Offer(resources=[Cpus(1), Mem(1024)])]
+    tasks = [TaskInfo(resources=[Cpus(1.5), Mem(512)]),
+             TaskInfo(resources=[Cpus(2), Mem(1024)]),  # larger than skipped
+             TaskInfo(resources=[Cpus(2), Mem(128)]),
+             TaskInfo(resources=[Cpus(0.5), Mem(1024)])]
+
+    bins, skip = bfh(tasks, offers, cpus=1, mem=1)
+    assert skip == tasks[:2]
+    assert bins[0][1] == [tasks[2]]
+    assert bins[1][1] == [tasks[3]]
+
+
+@pytest.mark.parametrize('packer', [dp, dpd, l2, l2d])
+def test_vector_packers(tasks, offers, packer):
+    bins, skip = packer(tasks, offers, cpus=1, mem=1)
+    assert tasks[2] in skip
+    assert len(skip) + sum(len(content) for _, content in bins) == len(tasks)
+    for offer, content in bins:
+        assert sum(content) <= offer
+
+
+@pytest.mark.parametrize('packer', [dp, l2])
+def test_vector_packers_balance(packer):
+    offers = [Offer(resources=[Cpus(8), Mem(1024)]),
+              Offer(resources=[Cpus(1), Mem(8192)])]
+    tasks = [TaskInfo(resources=[Cpus(0.5), Mem(4096)]),
+             TaskInfo(resources=[Cpus(4), Mem(512)])]
+
+    bins, skip = packer(tasks, offers, cpus=1, mem=1)
+    assert skip == []
+    assert bins[0][1] == [tasks[1]]
+    assert bins[1][1] == [tasks[0]]
+
+
+@pytest.mark.parametrize('packer', [ff, ffd, mr, mrpq, bf, bfd, bfh, bfhd,
+                                    dp, dpd, l2, l2d])
+def test_discrete_resources(packer):
+    offers = [Offer(resources=[Cpus(4), Mem(4096), Ports([(31000, 31001)])]),
+              Offer(resources=[Cpus(4), Mem(4096), Ports([(31000, 31005)]),
+                               SetResource(name='gpus', items=['gpu0'])])]
+    tasks = [TaskInfo(resources=[Cpus(1), Mem(128), Ports([(31000, 31000)])]),
+             TaskInfo(resources=[Cpus(1), Mem(128), Ports([(31000, 31000)])]),
+             TaskInfo(resources=[Cpus(1), Mem(128), Ports([(31000, 31000)])]),
+             TaskInfo(resources=[Cpus(1), Mem(128),
+                                 SetResource(name='gpus', items=['gpu0'])]),
+             TaskInfo(resources=[Cpus(1), Mem(128),
+                                 SetResource(name='gpus', items=['gpu1'])])]
+
+    kwargs = {} if packer is ff else dict(cpus=1, mem=1)
+    bins, skip = packer(tasks, offers, **kwargs)
+    placed = [task for _, content in bins for task in content]
+    assert len(placed) + len(skip) == len(tasks)
+    assert tasks[4] in skip  # no such gpu
+    for offer, content in bins:
+        # a port or gpu is never allocated twice
+        assert sum(content) <= offer
+        ports = [task.ports for task in content]
+        assert sum(len(p.intervals) for p in ports) == len(
+            set(i for p in ports for i in p.intervals))
+    if packer not in (mr, mrpq):  # max-rest doesn't look for a fitting bin
+        assert len(skip) == 2
@@ -0,0 +1,99 @@
+from __future__ import absolute_import, division, print_function
+
+import pytest
+from mentor import binpack
+from mentor.proxies.messages import (Cpus, Mem, Offer, Ports, ScalarResource,
+                                    TaskInfo)
+
+np = pytest.importorskip('numpy')
+vectorized = pytest.importorskip('mentor.binpack_numpy')
+
+
+@pytest.fixture
+def offers():
+    resources = [(1.1, 2048),
+                 (2.0, 512),
+                 (0.8, 1024),
+                 (1.6, 2048)]
+    return [Offer(resources=[Cpus(cpus), Mem(mem)])
+            for cpus, mem in resources]
+
+
+@pytest.fixture
+def tasks():
+    resources = [(0.1, 128),
+                 (1.0, 256),
+                 (3.0, 4096),
+                 (0.2, 64),
+                 (1.4, 1024),
+                 (0.5, 128),
+                 (0.1, 128)]
+
+    return [TaskInfo(resources=[Cpus(cpus), Mem(mem)])
+            for cpus, mem in resources]
+
+
+def test_resources(offers):
+    arr = vectorized.resources(offers)
+    assert arr.shape == (4, 3)
+    assert arr[:, 0].tolist() == [1.1, 2.0, 0.8, 1.6]
+    assert arr[:, 1].tolist() == [2048, 512, 1024, 2048]
+    assert arr[:, 2].tolist() == [0, 0, 0, 0]
+
+
+def test_weight(offers):
+    arr = vectorized.resources(offers)
+    for kwargs in [dict(cpus=1), dict(cpus=1, mem=1), dict(cpus=4, mem=1.5)]:
+        expected = binpack.weight(offers, **kwargs)
+        assert np.allclose(vectorized.weight(arr, **kwargs), expected)
+
+    with pytest.raises(ValueError):
+        vectorized.weight(arr)
+
+
+@pytest.mark.parametrize('name,kwargs', [
+    ('ff', {}),
+    ('ffd', {'cpus': 1, 'mem': 1}),
+    ('mr', {'cpus': 1, 'mem': 1}),
+    ('bf', {'cpus': 1, 'mem': 1}),
+    ('bfd', {'cpus': 1, 'mem': 1})])
+def test_same_as_pure_python(tasks, offers, name, kwargs):
+    expected_bins, expected_skip = getattr(binpack, name)(tasks, offers,
+                                                          **kwargs)
+    bins, skip = getattr(vectorized, name)(tasks, offers, **kwargs)
+
+    assert skip == expected_skip
+    assert [content for _, content in bins] == [content for _, content
+                                               in expected_bins]
+    assert [target for target, _ in bins] == offers
+
+
+def test_custom_scalar_resources(tasks, offers):
+    offers[0].resources.append(ScalarResource(name='gpus', value=1))
+    tasks[0].resources.append(ScalarResource(name='gpus', value=2))
+    assert vectorized.names(offers) == ['cpus', 'mem', 'disk', 'gpus']
+
+    bins, skip = vectorized.ff(tasks[:1], offers)
+    assert all(content == [] for _, content in bins)
+    assert skip == [tasks[0]]
+
+    tasks[1].resources.append(ScalarResource(name='gpus', value=1))
+    bins, skip = vectorized.ff(tasks[1:2], offers)
+    assert bins[0][1] == [tasks[1]]
+
+
+@pytest.mark.parametrize('name', ['ff', 'ffd', 'mr', 'bf', 'bfd'])
+def test_discrete_resources_fallback(name):
+    offers = [Offer(resources=[Cpus(4), Mem(4096), Ports([(31000, 31000)])]),
+              Offer(resources=[Cpus(4), Mem(4096), Ports([(31001, 31001)])])]
+    tasks = [TaskInfo(resources=[Cpus(1), Mem(128), Ports([(31000, 31000)])])
+             for _ in range(3)]
+
+    kwargs = {} if name == 'ff' else dict(cpus=1, mem=1)
+    bins, skip = getattr(vectorized, name)(tasks, offers, **kwargs)
+    expected_bins, expected_skip = getattr(binpack, name)(tasks, offers,
+                                                          **kwargs)
+    assert skip == expected_skip
+    assert [content for _, content in bins] == [content for _, content
+                                               in expected_bins]
+    assert len(skip) == 2  # the port is only offered once
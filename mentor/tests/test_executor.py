@@ -1,7 +1,13 @@
 from __future__ import absolute_import, division, print_function
 
-from mentor.executor import OneOffExecutor, Running
-from mentor.messages import PythonTask, PythonTaskStatus
+import os
+import time
+
+import pytest
+from mentor.executor import OneOffExecutor, PersistentExecutor, Running, parse
+from mentor.messages import (Function, FunctionCacheMiss, PythonTask,
+                             PythonTaskStatus)
+from mentor.proxies.messages import Cpus, Mem, decode, encode
 from mentor.utils import RemoteException
 
 
@@ -68,6 +74,234 @@ def test_failed_status_updates(mocker):
     assert status.message == 'Booom!'
 
 
+@pytest.fixture
+def driver(mocker):
+    driver = mocker.Mock()
+    # child mocks are created lazily, which isn't thread-safe
+    driver.update = mocker.Mock()
+    driver.stop = mocker.Mock()
+    return driver
+
+
+def test_persistent_executor_runs_many_tasks(driver):
+    executor = PersistentExecutor(idle_timeout=60, workers=2)
+
+    tasks = [PythonTask(fn=sum, args=[range(i)]) for i in range(5)]
+    for task in tasks:
+        executor.on_launch(driver, task)
+    executor.join()
+
+    finished = {status.task_id.value: status.data
+                for (status,), _ in driver.update.call_args_list
+                if status.state == 'TASK_FINISHED'}
+    assert finished == {task.id.value: task() for task in tasks}
+    assert executor.running == {}
+    driver.stop.assert_not_called()
+    executor.timer.cancel()
+
+
+def test_persistent_executor_idle_timeout(driver):
+    executor = PersistentExecutor(idle_timeout=0.2)
+
+    executor.on_registered(driver, None, None, None)
+    executor.on_launch(driver, PythonTask(fn=time.sleep, args=[0.1]))
+    time.sleep(0.25)
+    driver.stop.assert_not_called()  # the timer is reset by the launch
+
+    time.sleep(0.25)
+    driver.stop.assert_called_once()
+
+
+def states(driver):
+    return [(status.task_id.value, status.state)
+            for (status,), _ in driver.update.call_args_list]
+
+
+def test_persistent_executor_capacity(driver):
+    executor = PersistentExecutor()
+
+    first = PythonTask(fn=time.sleep, args=[0.2],
+                       resources=[Cpus(1.5), Mem(64)])
+    second = PythonTask(fn=time.sleep, args=[0.2],
+                        resources=[Cpus(1), Mem(64)])
+    executor.on_launch(driver, first)
+    assert executor.capacity() == 2
+    executor.on_launch(driver, second)
+    assert executor.capacity() == 3  # grows with the launched tasks
+    assert executor.active == 2 and not executor.pending
+    executor.join()
+    assert executor.capacity() == 1
+    executor.timer.cancel()
+
+
+def test_persistent_executor_shares_worker(driver):
+    executor = PersistentExecutor()
+
+    tasks = [PythonTask(fn=time.sleep, args=[0.1],
+                        resources=[Cpus(0.1), Mem(64)]) for i in range(3)]
+    for task in tasks:
+        executor.on_launch(driver, task)
+    assert executor.active == 1
+    assert list(executor.pending) == [task.id.value for task in tasks[1:]]
+    executor.join()
+
+    assert [state for _, state in states(driver)] == [
+        'TASK_RUNNING', 'TASK_FINISHED'] * 3  # one after the other
+    executor.timer.cancel()
+
+
+def test_persistent_executor_process_died(driver):
+    executor = PersistentExecutor(workers=1, processes=True)
+
+    task = PythonTask(fn=os._exit, args=[3])
+    executor.on_launch(driver, task)
+    executor.join()
+
+    assert states(driver) == [(task.id.value, 'TASK_RUNNING'),
+                              (task.id.value, 'TASK_FAILED')]
+    executor.timer.cancel()
+
+
+def test_persistent_executor_kills_pending_task(driver):
+    executor = PersistentExecutor(workers=1)
+
+    running = PythonTask(fn=time.sleep, args=[0.2])
+    pending = PythonTask(fn=sum, args=[range(5)])
+    executor.on_launch(driver, running)
+    executor.on_launch(driver, pending)
+    executor.on_kill(driver, pending.id)
+    executor.join()
+
+    assert sorted(states(driver)) == sorted([
+        (running.id.value, 'TASK_RUNNING'),
+        (running.id.value, 'TASK_FINISHED'),
+        (pending.id.value, 'TASK_KILLED')])
+    assert executor.running == {}
+    executor.timer.cancel()
+
+
+def test_persistent_executor_kills_dispatched_task(mocker, driver):
+    workers = []
+
+    class Deferred(object):  # the worker doesn't start until called
+
+        def __init__(self, target, args):
+            self.target, self.args = target, args
+            self.daemon = False
+
+        def start(self):
+            workers.append(self)
+
+    executor = PersistentExecutor(workers=1)
+    mocker.patch('mentor.executor.threading.Thread', Deferred)
+    task = PythonTask(fn=sum, args=[range(5)])
+    executor.on_launch(driver, task)
+    assert not executor.pending and len(workers) == 1
+    executor.on_kill(driver, task.id)
+    mocker.stopall()
+
+    worker, = workers
+    worker.target(*worker.args)
+    assert states(driver) == [(task.id.value, 'TASK_KILLED')]
+    assert executor.running == {} and executor.active == 0
+    executor.timer.cancel()
+
+
+def test_persistent_executor_processes(driver):
+    executor = PersistentExecutor(workers=2, processes=True)
+
+    task = PythonTask(fn=os.getpid)
+    failing = PythonTask(fn=lambda: 1 / 0)
+    executor.on_launch(driver, task)
+    executor.on_launch(driver, failing)
+    executor.join()
+
+    statuses = {status.task_id.value: status
+                for (status,), _ in driver.update.call_args_list
+                if status.has_terminated()}
+    assert statuses[task.id.value].state == 'TASK_FINISHED'
+    assert statuses[task.id.value].data != os.getpid()  # run in a child
+    assert statuses[failing.id.value].state == 'TASK_FAILED'
+    assert isinstance(statuses[failing.id.value].exception,
+                      ZeroDivisionError)
+    executor.timer.cancel()
+
+
+def test_persistent_executor_kills_running_process(driver):
+    executor = PersistentExecutor(workers=1, processes=True)
+
+    task = PythonTask(fn=time.sleep, args=[10])
+    executor.on_launch(driver, task)
+    while task.id.value not in executor.children:
+        time.sleep(0.01)
+
+    start = time.time()
+    executor.on_kill(driver, task.id)
+    executor.join()
+    assert time.time() - start < 5  # the worker has been released
+    assert states(driver) == [(task.id.value, 'TASK_RUNNING'),
+                              (task.id.value, 'TASK_KILLED')]
+    assert executor.children == {}
+    executor.timer.cancel()
+
+
+def test_persistent_executor_caches_functions(driver):
+    executor = PersistentExecutor(workers=4, processes=True)
+    offset = 42
+
+    def add(x):
+        return x + offset
+
+    tasks = [PythonTask(fn=add, args=[i], persistent=True) for i in range(4)]
+    for task in tasks:
+        task.ship(payload=task is tasks[0])
+    missing = PythonTask(fn=lambda: None, persistent=True)
+    missing.data = (Function('unknown'), [], {})
+
+    for task in tasks + [missing]:  # as received by the executor
+        executor.on_launch(driver, decode(encode(task)))
+    executor.join()
+
+    assert tasks[0].function.digest in Function.cache
+    statuses = {status.task_id.value: status
+                for (status,), _ in driver.update.call_args_list
+                if status.has_terminated()}
+    assert [statuses[task.id.value].data for task in tasks] == [42, 43, 44, 45]
+    assert statuses[missing.id.value].state == 'TASK_FAILED'
+    assert isinstance(statuses[missing.id.value].exception, FunctionCacheMiss)
+    assert executor.calls == {}
+    executor.timer.cancel()
+
+
+def test_executor_arguments():
+    args = parse([])
+    assert not args.persistent
+    assert not args.processes
+    assert args.workers is None
+
+    args = parse(['--persistent', '--idle-timeout', '5', '--workers', '2',
+                  '--processes'])
+    assert args.persistent
+    assert args.processes
+    assert args.idle_timeout == 5
+    assert args.workers == 2
+    assert not args.sparse and not args.lazy
+
+    args = parse(['--sparse', '--lazy'])
+    assert args.sparse and args.lazy
+
+
+def test_runner_decoding(mocker):
+    driver = mocker.patch('mentor.executor.MesosExecutorDriver')
+    mocker.patch('mentor.executor.atexit')
+    mocker.patch('mentor.executor.signal')
+
+    Running(OneOffExecutor(), sparse=True, lazy=True)
+    (proxy,), _ = driver.call_args
+    assert proxy.lazy
+    assert proxy.decode.keywords == {'sparse': True}
+
+
 # def test_runner_context_manager():
 #     executor = OneOffExecutor()
 #     with Running(executor):
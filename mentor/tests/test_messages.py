@@ -2,8 +2,9 @@ from __future__ import absolute_import, division, print_function
 
 import cloudpickle
 from mesos.interface import mesos_pb2
-from mentor.messages import PythonTask, PythonTaskStatus
-from mentor.proxies.messages import TaskID, decode, encode
+from mentor.messages import (Function, FunctionCacheMiss, PythonTask,
+                             PythonTaskStatus)
+from mentor.proxies.messages import SlaveID, TaskID, decode, encode
 from mentor.utils import RemoteException
 
 
@@ -76,13 +77,15 @@ def test_python_task_decode():
 
     assert isinstance(task, PythonTask)
     assert task.data == data
-    assert task['data'] == dumped
+    # the function and the arguments are pickled separately
+    assert task['data'] == (cloudpickle.dumps(fn) +
+                            cloudpickle.dumps((args, kwargs)))
 
 
 def test_python_task_encode():
     fn, args, kwargs = sum, [range(5)], {}
     data = (fn, args, kwargs)
-    dumped = cloudpickle.dumps(data)
+    dumped = cloudpickle.dumps(fn) + cloudpickle.dumps((args, kwargs))
 
     task = PythonTask(fn=fn, args=args, kwargs=kwargs,
                       id='test-id',
@@ -145,3 +148,136 @@ def test_python_task_status_exception():
 
     assert isinstance(status.exception, RemoteException)
     assert isinstance(status.exception, TypeError)
+
+
+def test_python_task_persistent_executor():
+    first = PythonTask(fn=sum, args=[range(5)], persistent=True)
+    second = PythonTask(fn=max, args=[range(5)], persistent=True)
+    other = PythonTask(fn=sum, args=[range(5)], persistent=True,
+                       docker='daskos/mentor:other')
+    oneoff = PythonTask(fn=sum, args=[range(5)])
+
+    assert first.command == 'python -m mentor.executor --persistent'
+    assert first.executor.id == second.executor.id
+    assert first.executor.id != other.executor.id
+    assert oneoff.executor.id != PythonTask(fn=sum).executor.id
+
+    proto = encode(first)
+    assert proto.executor.executor_id.value == first.executor.id.value
+
+
+def test_python_task_runtime_id():
+    envs = {'A': '1', 'B': '2', 'C': '3'}
+    task = PythonTask(envs=envs, uris=['hdfs://lib.zip'], persistent=True)
+    same = PythonTask(envs=dict(reversed(list(envs.items()))),
+                      uris=['hdfs://lib.zip'], persistent=True)
+    assert task.executor.id == same.executor.id
+    assert task.runtime_id() == same.runtime_id()
+
+    for kwargs in [dict(envs={'A': '1'}), dict(uris=['hdfs://other.zip']),
+                   dict(command='python -m other'), dict(docker='other'),
+                   dict(force_pull=True)]:
+        other = PythonTask(**dict(dict(envs=envs, uris=['hdfs://lib.zip'],
+                                       persistent=True), **kwargs))
+        assert other.executor.id != task.executor.id
+
+
+def test_python_task_runtime_id_follows_changes():
+    task = PythonTask(fn=sum, persistent=True)
+    task.envs = {'A': '1'}
+    task.uris = ['hdfs://lib.zip']
+    task.docker = 'daskos/mentor:other'
+    same = PythonTask(fn=sum, persistent=True, envs={'A': '1'},
+                      uris=['hdfs://lib.zip'], docker='daskos/mentor:other')
+    assert task.executor.id == same.executor.id
+
+    task.force_pull = True
+    assert task.executor.id != same.executor.id
+    assert task.executor.id.value == task.runtime_id()
+
+    pinned = PythonTask(fn=sum, executor_id='warm-executor', persistent=True)
+    pinned.envs = {'A': '1'}
+    assert pinned.executor.id.value == 'warm-executor'
+
+
+def test_python_task_pinned_executor_id():
+    task = PythonTask(fn=sum, executor_id='warm-executor')
+    assert task.executor.id.value == 'warm-executor'
+
+    task = PythonTask(fn=sum, executor_id='warm-executor', persistent=True)
+    assert task.executor.id.value == 'warm-executor'
+    assert task.command.endswith('--persistent')
+
+
+def test_python_task_function_shipped():
+    table = dict.fromkeys(range(1000), 'value')
+
+    def lookup(key):
+        return table[key]
+
+    first, second = [PythonTask(fn=lookup, args=[i], persistent=True)
+                     for i in range(2)]
+    assert first.function is second.function  # identical pickles
+    fn, args, kwargs = first.data
+    assert isinstance(fn, Function) and fn.payload is None
+
+    first.ship()
+    second.ship(payload=False)
+    assert first.data[0].payload is not None
+    assert second.data[0].payload is None  # referenced by digest
+    assert len(second['data']) < len(first['data'])
+
+    executed = decode(encode(first))
+    assert executed() == 'value'
+    executed = decode(encode(second))
+    assert executed() == 'value'  # cached by the executor process
+
+
+def test_python_task_function_state_changed():
+    state = {'value': 1}
+
+    def read():
+        return state['value']
+
+    before = PythonTask(fn=read, persistent=True)
+    state['value'] = 2
+    after = PythonTask(fn=read, persistent=True)
+    assert before.function.digest != after.function.digest
+
+    after.ship()
+    assert decode(encode(after))() == 2
+
+
+def test_python_task_wrapped_function(mocker):
+    function = Function.wrap(sum)
+    tasks = [PythonTask(fn=function, args=[range(i)], persistent=True)
+             for i in range(3)]
+    assert all(task.function is function for task in tasks)
+
+    task = tasks[2]
+    dumps = mocker.spy(cloudpickle, 'dumps')
+    task.ship()
+    assert dumps.call_count == 1  # the arguments aren't pickled again
+    assert task.data[0].payload is not None
+    assert task() == 1
+
+
+def test_python_task_function_placement():
+    task = PythonTask(fn=sum, persistent=True)
+    task.slave_id = SlaveID(value='agent-1')
+    assert task.placement() == ('agent-1', task.executor.id.value,
+                                task.function.digest)
+
+    oneoff = PythonTask(fn=sum)
+    oneoff.slave_id = SlaveID(value='agent-1')
+    assert oneoff.placement() is None
+
+
+def test_python_task_function_cache_miss():
+    task = PythonTask(fn=lambda: 'miss', persistent=True, retries=1)
+    status = PythonTaskStatus(task_id=task.id, state='TASK_FAILED',
+                              data=(FunctionCacheMiss(task.function.digest),
+                                    'traceback'),
+                              message='function cache miss')
+    task.update(status)  # doesn't count as an attempt
+    assert task.status.state == 'TASK_STAGING'
@@ -2,7 +2,10 @@ from __future__ import absolute_import, division, print_function
 
 import pytest
 from sample_pb2 import MessageOfTypes
-from mentor.protobuf import dict_to_protobuf, protobuf_to_dict
+from mentor.protobuf import (CANDIDATES_CACHE, COMPILED_DECODERS,
+                             COMPILED_ENCODERS, DECODERS_CACHE,
+                             REVERSE_TYPE_CALLABLE_MAP, TYPE_CALLABLE_MAP,
+                             dict_to_protobuf, protobuf_to_dict)
 
 
 @pytest.fixture
@@ -192,3 +195,85 @@ def test_reverse_type_conversion(m):
     m2 = dict_to_protobuf(d, MessageOfTypes)
 
     assert m == m2
+
+
+def test_decoders_cached(m):
+    containers = []
+    protobuf_to_dict(m, containers)
+    key = (MessageOfTypes.DESCRIPTOR, id(containers), id(TYPE_CALLABLE_MAP),
+           False, False)
+    registry, converters, decoders = DECODERS_CACHE[key]
+    assert registry is containers
+    assert list(decoders) == [
+        field.name for field in MessageOfTypes.DESCRIPTOR.fields]
+
+    protobuf_to_dict(m, containers)
+    assert DECODERS_CACHE[key][2] is decoders
+
+
+def test_containers_cache_follows_registry(m):
+    class Types(dict):
+        pass
+
+    class Nested(dict):
+        pass
+
+    class Other(dict):
+        pass
+
+    containers = [(MessageOfTypes.NestedType, Nested)]
+    d = protobuf_to_dict(m, containers)
+    assert type(d) is dict
+    assert type(d['nested']) is Nested
+
+    containers.insert(0, (MessageOfTypes, Types))
+    d = protobuf_to_dict(m, containers)
+    assert type(d) is Types
+    assert type(d['nested']) is Nested
+
+    # object definitions are matched on their set fields
+    containers.insert(0, (MessageOfTypes.NestedType(req='other'), Other))
+    d = protobuf_to_dict(m, containers)
+    assert type(d['nested']) is Nested
+    m.nested.req = 'other'
+    d = protobuf_to_dict(m, containers)
+    assert type(d['nested']) is Other
+
+    _, _, candidates = CANDIDATES_CACHE[(MessageOfTypes.NestedType,
+                                         id(containers))]
+    assert [cnt for _, cnt in candidates] == [Other, Nested]
+
+
+def test_compiled_functions_cached(m):
+    containers = []
+    d = protobuf_to_dict(m, containers)
+    dict_to_protobuf(d, MessageOfTypes, containers)
+
+    key = (MessageOfTypes.DESCRIPTOR, id(containers), id(TYPE_CALLABLE_MAP))
+    _, _, decoder = COMPILED_DECODERS[key]
+    assert decoder(m) == d
+
+    key = (MessageOfTypes.DESCRIPTOR, id(containers),
+           id(REVERSE_TYPE_CALLABLE_MAP))
+    _, _, encoder = COMPILED_ENCODERS[key]
+    assert encoder(d, MessageOfTypes(), True) == m
+
+    d['unknown'] = 1
+    with pytest.raises(KeyError):
+        encoder(d, MessageOfTypes(), True)
+    assert encoder(d, MessageOfTypes(), False) == m
+
+
+def test_lazy_decode_plain_containers(m):
+    # containers without _bind support are always decoded eagerly
+    assert protobuf_to_dict(m, lazy=True) == protobuf_to_dict(m)
+
+
+def test_sparse_decode(m):
+    d = protobuf_to_dict(m, sparse=True)
+    assert set(d) == set(field.name for field, _ in m.ListFields())
+    assert d == dict((k, v) for k, v in protobuf_to_dict(m).items()
+                     if k in d)
+
+    empty = protobuf_to_dict(MessageOfTypes(), sparse=True)
+    assert empty == {}
@@ -1,10 +1,17 @@
 from __future__ import absolute_import, division, print_function
 
+import signal
+import threading
+import time
+
 import pytest
-from mentor.messages import PythonTask, PythonTaskStatus
-from mentor.proxies.messages import (Cpus, Disk, Mem, Offer, OfferID, SlaveID,
-                                    TaskID)
-from mentor.scheduler import QueueScheduler, Running
+from mentor.binpack import bfd, bfh, ff, l2d, mrpq
+from mentor.messages import FunctionCacheMiss, PythonTask, PythonTaskStatus
+from mentor.proxies.messages import (Cpus, Disk, ExecutorID, Mem, Offer,
+                                    OfferID, SlaveID, TaskID, TaskStatus,
+                                    encode)
+from mentor.scheduler import QueueScheduler, Running, aggregate
+from mentor.utils import TimeoutError
 
 
 @pytest.fixture
@@ -41,10 +48,308 @@ def test_launch_decline(mocker, python_task, offers):
     assert isinstance(args[1][0], PythonTask)
     assert args[1][0].task_id.value == 'test-task-id'
 
-    args, kwargs = calls[1]
-    assert isinstance(args[0], OfferID)
-    assert args[0].value == 'second-offer'
-    assert args[1] == []  # declines via launch empty task list
+    assert len(calls) == 1
+
+    # declines the unused offers at once via accept without operations
+    (offer_ids, operations, filters), kwargs = driver.accept.call_args
+    assert [offer_id.value for offer_id in offer_ids] == ['second-offer']
+    assert operations == []
+    assert filters.refuse_seconds == 300  # no more tasks waiting
+    driver.suppress.assert_called_once()
+
+
+def test_packer_selection(mocker, python_task, offers):
+    driver = mocker.Mock()
+    packer = mocker.Mock(wraps=l2d)
+    sched = QueueScheduler(packer=packer, weights={'cpus': 1})
+
+    sched.submit(python_task)
+    sched.on_offers(driver, offers)
+
+    args, kwargs = packer.call_args
+    assert args == ([python_task], offers)
+    assert kwargs == {'cpus': 1}
+    assert driver.launch.call_count == 1
+    assert driver.accept.call_count == 1
+
+
+def test_packer_without_weights(mocker, python_task, offers):
+    driver = mocker.Mock()
+    sched = QueueScheduler(packer=ff)
+
+    sched.submit(python_task)
+    sched.on_offers(driver, offers)
+    assert driver.launch.call_count == 1
+
+
+def test_aggregate(offers):
+    other = Offer(id=OfferID(value='other-offer'),
+                  slave_id=SlaveID(value='other-slave'),
+                  resources=[Cpus(1), Mem(128), Disk(0)])
+    groups = aggregate(offers + [other])
+
+    assert len(groups) == 2
+    virtual, group = groups[0]
+    assert group == offers
+    assert virtual.slave_id.value == 'test-slave'
+    assert (virtual.cpus, virtual.mem, virtual.disk) == (3, 1280, 3072)
+    assert list(virtual.vector) == [3, 1280, 3072]
+    assert groups[1] == (other, [other])
+
+
+@pytest.mark.parametrize('packer', [bfd, bfh, mrpq])
+def test_aggregated_launch(mocker, offers, packer):
+    driver = mocker.Mock()
+    sched = QueueScheduler(packer=packer, weights={'cpus': 1, 'mem': 1},
+                           aggregate=True)
+    # fits into neither offer alone
+    task = PythonTask(fn=sum, args=[range(5)],
+                      resources=[Cpus(2.5), Mem(1024), Disk(0)])
+    sched.submit(task)
+    sched.on_offers(driver, offers)
+
+    assert driver.launch.call_count == 0
+    (offer_ids, operations, filters), _ = driver.accept.call_args
+    assert [offer_id.value for offer_id in offer_ids] == ['first-offer',
+                                                          'second-offer']
+    pb = encode(operations[0])
+    assert pb.type == pb.LAUNCH
+    assert pb.launch.task_infos[0].task_id.value == task.id.value
+    assert task.status.state == 'TASK_STARTING'
+    assert task.slave_id.value == 'test-slave'
+
+
+def test_offer_holding(mocker, python_task, offers):
+    driver = mocker.Mock()
+    sched = QueueScheduler(hold=60)
+
+    sched.on_offers(driver, offers)
+    assert driver.launch.call_count == 0
+    assert list(sched.held) == ['first-offer', 'second-offer']
+
+    # launched within a tick using a held offer
+    sched.submit(python_task)
+    sched.flusher.join()
+    args, kwargs = driver.launch.call_args
+    assert args[0].value == 'first-offer'
+    assert args[1] == [python_task]
+    assert args[2].refuse_seconds == 0  # the rest is re-offered at once
+    assert python_task.status.state == 'TASK_STARTING'
+    assert list(sched.held) == ['second-offer']
+
+    sched.on_rescinded(driver, OfferID(value='second-offer'))
+    assert not sched.held
+    assert driver.launch.call_count == 1
+
+
+def test_held_offers_batch_submits(mocker):
+    driver = mocker.Mock()
+    sched = QueueScheduler(hold=60, tick=0.2)
+    offers = [Offer(id=OfferID(value='offer-{}'.format(i)),
+                    slave_id=SlaveID(value='slave-{}'.format(i)),
+                    resources=[Cpus(8), Mem(8192), Disk(0)])
+              for i in range(2)]
+    sched.on_offers(driver, offers)
+
+    tasks = [PythonTask(fn=sum, args=[range(i)],
+                        resources=[Cpus(1), Mem(128), Disk(0)])
+             for i in range(5)]
+    flusher = None
+    for task in tasks:
+        sched.submit(task)
+        flusher = flusher or sched.flusher
+        assert sched.flusher is flusher  # a single flush per tick
+    assert driver.launch.call_count == 0
+
+    flusher.join()
+    (offer_id, launched, filters), _ = driver.launch.call_args
+    assert driver.launch.call_count == 1
+    assert sorted(task.id.value for task in launched) == sorted(
+        task.id.value for task in tasks)
+    assert filters.refuse_seconds == 0
+    assert all(task.status.state == 'TASK_STARTING' for task in tasks)
+    assert list(sched.held) == ['offer-1']
+
+
+def test_held_offers_expire(mocker, offers):
+    driver = mocker.Mock()
+    sched = QueueScheduler(hold=0.05)
+
+    sched.on_offers(driver, offers)
+    assert driver.launch.call_count == 0
+    time.sleep(0.3)
+
+    assert not sched.held
+    offer_ids, operations, filters = driver.accept.call_args[0]
+    assert [offer_id.value for offer_id in offer_ids] == ['first-offer',
+                                                          'second-offer']
+    assert operations == []
+
+
+def test_adaptive_decline_filters(mocker, offers):
+    driver = mocker.Mock()
+    sched = QueueScheduler(refuse_seconds=(5, 100))
+    # none of them fits
+    tasks = [PythonTask(fn=sum, args=[range(i)],
+                        resources=[Cpus(10), Mem(128), Disk(0)])
+             for i in range(3)]
+    for task in tasks:
+        sched.submit(task)
+
+    sched.on_offers(driver, offers)
+    offer_ids, operations, filters = driver.accept.call_args[0]
+    assert len(offer_ids) == 2
+    assert filters.refuse_seconds == 25
+    assert not driver.suppress.called
+
+    for task in tasks[1:]:
+        del sched.tasks[task.id]
+    assert sched.filters().refuse_seconds == 50
+    sched.tasks.clear()
+    assert sched.filters().refuse_seconds == 100
+
+
+def test_decline_per_agent(mocker, offers):
+    driver = mocker.Mock()
+    sched = QueueScheduler()
+    other = Offer(id=OfferID(value='other-offer'),
+                  slave_id=SlaveID(value='other-slave'),
+                  resources=[Cpus(1), Mem(128), Disk(0)])
+
+    sched.on_offers(driver, [offers[0], other, offers[1]])
+    assert driver.accept.call_count == 2
+    declined = [[offer_id.value for offer_id in offer_ids]
+                for (offer_ids, _, _), _ in driver.accept.call_args_list]
+    assert declined == [['first-offer', 'second-offer'], ['other-offer']]
+
+
+def test_revive_after_decline(mocker, python_task, offers):
+    driver = mocker.Mock()
+    sched = QueueScheduler()
+    waiting = PythonTask(fn=sum, args=[range(3)],
+                         resources=[Cpus(10), Mem(128), Disk(0)])
+    sched.submit(waiting)
+
+    # declined with a long filter while a task is waiting
+    sched.on_offers(driver, offers)
+    offer_ids, operations, filters = driver.accept.call_args[0]
+    assert filters.refuse_seconds == 150
+    assert not driver.suppress.called
+
+    # the filters are cleared once a new task is submitted
+    sched.submit(python_task)
+    driver.revive.assert_called_once()
+    sched.submit(PythonTask(fn=sum, args=[range(2)]))
+    driver.revive.assert_called_once()
+
+
+def test_suppress_and_revive(mocker, python_task, offers):
+    driver = mocker.Mock()
+    sched = QueueScheduler()
+
+    sched.on_offers(driver, offers)
+    driver.suppress.assert_called_once()
+    assert sched.suppressed
+
+    sched.submit(python_task)
+    driver.revive.assert_called_once()
+    assert not sched.suppressed
+
+    sched.on_offers(driver, offers)
+    assert python_task.status.state == 'TASK_STARTING'
+    assert driver.suppress.call_count == 2
+
+    # revived again when a failed task is rescheduled
+    status = TaskStatus(task_id=python_task.id, state='TASK_LOST',
+                        message='agent lost')
+    sched.on_update(driver, status)
+    assert python_task.status.is_staging()
+    assert driver.revive.call_count == 2
+
+
+def test_functions_shipped(mocker, offers):
+    driver = mocker.Mock()
+    sched = QueueScheduler()
+    offset = 42
+
+    def add(x):
+        return x + offset
+
+    def payloads(tasks):
+        return [task.data[0].payload is not None for task in tasks]
+
+    first, second, third = [PythonTask(fn=add, args=[i], persistent=True)
+                            for i in range(3)]
+    sched.submit(first)
+    sched.submit(second)
+    sched.on_offers(driver, offers)
+    assert payloads([first, second]) == [True, True]  # none running yet
+    assert sched.shipped == set()
+
+    sched.on_update(driver, PythonTaskStatus(task_id=first.id,
+                                             state='TASK_RUNNING'))
+    assert sched.shipped == {first.placement()}
+
+    sched.submit(third)
+    sched.on_offers(driver, offers)
+    assert payloads([third]) == [False]  # cached by the executor
+
+    # e.g. the executor has been restarted meanwhile
+    miss = PythonTaskStatus(task_id=third.id, state='TASK_FAILED',
+                            data=(FunctionCacheMiss(third.function.digest),
+                                  'traceback'),
+                            message='function cache miss')
+    sched.on_update(driver, miss)
+    assert sched.shipped == set()
+    sched.on_offers(driver, offers)
+    assert payloads([third]) == [True]  # sent again
+
+    sched.on_update(driver, PythonTaskStatus(task_id=third.id,
+                                             state='TASK_RUNNING'))
+    assert sched.shipped == {third.placement()}
+    sched.on_executor_lost(driver, ExecutorID(value='other'),
+                           SlaveID(value='test-slave'), 1)
+    assert sched.shipped == {third.placement()}
+    sched.on_executor_lost(driver, third.executor.id,
+                           SlaveID(value='test-slave'), 1)
+    assert sched.shipped == set()
+
+
+def test_packing_budget(mocker, offers):
+    driver = mocker.Mock()
+
+    def slow_ff(items, targets):
+        time.sleep(0.05)
+        return ff(items, targets)
+
+    sched = QueueScheduler(packer=slow_ff, budget=0.01, batch=1)
+    tasks = [PythonTask(fn=sum, args=[range(i)],
+                        resources=[Cpus(0.1), Mem(128), Disk(0)])
+             for i in range(3)]
+    for task in tasks:
+        sched.submit(task)
+    sched.on_offers(driver, offers)
+
+    launched = [task for (_, launch, _), _ in driver.launch.call_args_list
+                for task in launch]
+    assert len(launched) == 1
+    assert launched[0].status.state == 'TASK_STARTING'
+    assert sorted(task.status.state for task in tasks) == [
+        'TASK_STAGING', 'TASK_STAGING', 'TASK_STARTING']
+
+
+def test_batched_packing(offers):
+    sched = QueueScheduler(budget=10, batch=2)
+    tasks = [PythonTask(fn=sum, args=[range(i)],
+                        resources=[Cpus(0.6), Mem(128), Disk(0)])
+             for i in range(4)]
+
+    bins, skip = sched.pack(tasks, offers)
+    assert [target for target, _ in bins] == offers
+    assert [len(content) for _, content in bins] == [2, 1]
+    assert len(skip) == 1
+    for offer, content in bins:
+        assert sum(content) <= offer
 
 
 def test_task_callbacks(mocker, python_task, offers):
@@ -98,7 +403,77 @@ def test_task_result(mocker, python_task, offers):
     assert python_task.status.data == 10
 
 
+def test_wait_for_termination(mocker, python_task, offers):
+    driver = mocker.Mock()
+    sched = QueueScheduler(name='test-scheduler')
+
+    sched.submit(python_task)
+    sched.on_offers(driver, offers)
+    assert sched.wait_for(python_task, 0.01) is False
+    with pytest.raises(TimeoutError):
+        sched.wait(0.01)
+
+    def finish():
+        time.sleep(0.05)
+        status = PythonTaskStatus(task_id=python_task.id,
+                                  state='TASK_FINISHED', data=python_task())
+        sched.on_update(driver, status)
+
+    waiters = [threading.Thread(target=sched.wait, args=(5,)),
+               threading.Thread(target=sched.wait_for,
+                                args=(python_task, 5))]
+    for waiter in waiters:
+        waiter.start()
+
+    start = time.time()
+    finish()
+    for waiter in waiters:
+        waiter.join()
+    assert time.time() - start < 0.1  # woken by the update, not polling
+
+    assert sched.is_idle()
+    assert sched.wait_for(python_task) is True  # terminated already
+    sched.wait()
+
+
 # integration test
+class Interrupted(Exception):
+    pass
+
+
+@pytest.mark.parametrize('method', ['wait', 'wait_for'])
+def test_wait_interruptible(mocker, python_task, method):
+    sched = QueueScheduler(name='test-scheduler')
+    sched.submit(python_task)
+
+    def handler(signum, frame):
+        raise Interrupted()
+
+    previous = signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, 0.05)
+    try:
+        with pytest.raises(Interrupted):  # untimed waits would block forever
+            if method == 'wait':
+                sched.wait()
+            else:
+                sched.wait_for(python_task)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def test_runner_decoding(mocker):
+    driver = mocker.patch('mentor.scheduler.MesosSchedulerDriver')
+    mocker.patch('mentor.scheduler.atexit')
+    mocker.patch('mentor.scheduler.signal')
+
+    Running(QueueScheduler(), name='test-scheduler', lazy=True, sparse=True)
+    (proxy, framework, _, _), _ = driver.call_args
+    assert proxy.lazy
+    assert proxy.decode.keywords == {'sparse': True}
+    assert framework.name == 'test-scheduler'
+
+
 def test_runner_context_manager():
     sched = QueueScheduler(name='test-scheduler')
     with Running(sched, name='test-scheduler'):
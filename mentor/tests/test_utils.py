@@ -1,6 +1,7 @@
 from __future__ import absolute_import, division, print_function
 
-from mentor.utils import remote_exception
+import pytest
+from mentor.utils import chunks, remote_exception
 
 
 def test_remote_exception():
@@ -12,3 +13,10 @@ def test_remote_exception():
     assert isinstance(a, TypeError)
     assert 'hello' in str(a)
     assert 'traceback' in str(a)
+
+
+def test_chunks():
+    assert list(chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunks([], 3)) == []
+    with pytest.raises(ValueError):
+        chunks(range(5), 0)
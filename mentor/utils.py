@@ -1,10 +1,13 @@
 from __future__ import absolute_import, division, print_function
 
 import signal
+from concurrent import futures
 from contextlib import contextmanager
+from itertools import islice
 
 
-class TimeoutError(Exception):
+class TimeoutError(futures.TimeoutError):
+    # the futures api raises it too, so it follows concurrent.futures
     pass
 
 
@@ -24,6 +27,26 @@ def timeout(seconds):
         yield
 
 
+def chunks(iterable, size):
+    """Lazily splits the iterable to lists of at most size items"""
+    if size < 1:  # checked eagerly, unlike the generator's body
+        raise ValueError('chunksize must be >= 1, not {}'.format(size))
+    return _chunks(iter(iterable), size)
+
+
+def _chunks(iterator, size):
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def mapstar(fn, chunk):
+    """Applies fn to every argument tuple of a chunk, run remotely"""
+    return [fn(*args) for args in chunk]
+
+
 class RemoteException(Exception):
     """ Remote Exception
 
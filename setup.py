@@ -17,7 +17,8 @@ setup(name='mentor',
       long_description=(open('README.md').read() if exists('README.md')
                         else ''),
       install_requires=['cloudpickle', 'kazoo', 'futures'],
-      extras_require={'mesos': ['mesos.native']},
+      extras_require={'mesos': ['mesos.native'],
+                      'numpy': ['numpy']},
       setup_requires=['pytest-runner'],
       tests_require=['pytest-mock', 'pytest'],
       zip_safe=False)